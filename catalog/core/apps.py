@@ -8,3 +8,5 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         connections.configure(**settings.ELASTICSEARCH)
+        from .signals import connect_signals
+        connect_signals()
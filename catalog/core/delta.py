@@ -0,0 +1,84 @@
+import logging
+import time
+from datetime import datetime, timezone
+
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaQueue:
+    """Debounced queue of changed publication ids
+
+    Ids are kept in a redis sorted set scored by the time of their latest change, so repeated saves of the same
+    publication collapse into one entry that only becomes ready once it has been left alone for ``debounce`` seconds
+    """
+
+    def __init__(self, name, debounce):
+        self.key = 'catalog:delta:{}'.format(name)
+        self.debounce = debounce
+
+    @property
+    def connection(self):
+        return get_redis_connection('default')
+
+    def push(self, publication_ids, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        mapping = {publication_id: timestamp for publication_id in publication_ids}
+        if mapping:
+            self.connection.zadd(self.key, mapping)
+
+    def pop_ready(self):
+        """Remove and return the ids that have not changed for at least debounce seconds"""
+        cutoff = time.time() - self.debounce
+        with self.connection.pipeline() as pipeline:
+            pipeline.zrangebyscore(self.key, '-inf', cutoff)
+            pipeline.zremrangebyscore(self.key, '-inf', cutoff)
+            publication_ids, _ = pipeline.execute()
+        return {int(publication_id) for publication_id in publication_ids}
+
+    def __len__(self):
+        return self.connection.zcard(self.key)
+
+
+class PublicationChangeLog:
+    """Log of publication changes that leave no date_modified behind
+
+    Deleted through rows, cleared many to many relations and renamed shared rows are recorded in a redis sorted set
+    scored by the time of their latest change. Entries are kept for ``retention`` seconds, so date_modified watermarks
+    can include them without touching the publications themselves
+    """
+
+    def __init__(self, name, retention):
+        self.key = 'catalog:changes:{}'.format(name)
+        self.retention = retention
+
+    @property
+    def connection(self):
+        return get_redis_connection('default')
+
+    @staticmethod
+    def _to_datetime(score):
+        return datetime.fromtimestamp(float(score), tz=timezone.utc)
+
+    def record(self, publication_ids, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        mapping = {publication_id: timestamp for publication_id in publication_ids}
+        if mapping:
+            with self.connection.pipeline() as pipeline:
+                pipeline.zadd(self.key, mapping)
+                pipeline.zremrangebyscore(self.key, '-inf', '({}'.format(timestamp - self.retention))
+                pipeline.execute()
+
+    def changed_since(self, since):
+        """Ids of the publications changed after the datetime since"""
+        return {int(publication_id)
+                for publication_id in self.connection.zrangebyscore(self.key, '({}'.format(since.timestamp()), '+inf')}
+
+    def last_changed(self, publication_id):
+        score = self.connection.zscore(self.key, publication_id)
+        return None if score is None else self._to_datetime(score)
+
+    def latest(self):
+        entries = self.connection.zrevrange(self.key, 0, 0, withscores=True)
+        return self._to_datetime(entries[0][1]) if entries else None
@@ -8,7 +8,15 @@ logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
-    help = '''Build pandas dataframe cache of primary data'''
+    help = '''Build pandas dataframe cache of primary data and write it to the visualization snapshot'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', default=False,
+                            help='Rebuild every dataframe instead of only refreshing publications changed since '
+                                 'the last run')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of dataframes to build concurrently, each with its own database connection. '
+                                 'Defaults to the VISUALIZATION_CACHE_BUILD_WORKERS setting')
 
     def handle(self, *args, **options):
-        visualization_cache.get_or_create_many()
\ No newline at end of file
+        visualization_cache.refresh(full=options['full'], workers=options['workers'])
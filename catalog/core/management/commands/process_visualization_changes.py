@@ -0,0 +1,34 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.core.signals import visualization_changes
+from catalog.core.visualization.data_access import visualization_cache
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '''Apply publications changed by curators to the cached visualization dataframes. Each batch of changes is
+    published as a new cache generation which also retires the plot cache entries keyed by the previous generation'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', default=False,
+                            help='Keep polling the change queue instead of exiting after one batch')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Seconds to sleep between polls of the change queue')
+
+    def handle(self, *args, **options):
+        while True:
+            publication_ids = visualization_changes.pop_ready()
+            if publication_ids:
+                logger.info('applying changes to %s publications', len(publication_ids))
+                try:
+                    visualization_cache.apply_changes(publication_ids)
+                except Exception:
+                    visualization_changes.push(publication_ids)
+                    raise
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,55 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from catalog.core.search_indexes import get_unpublished_indexed_publication_ids, sync_publication_docs
+from catalog.core.signals import search_index_changes
+from catalog.core.visualization.data_access import get_changed_publication_ids
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = '''Sync the public search index documents of publications changed by curators without a full rebuild'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default=None,
+                            help='Catch up with every publication modified since this ISO 8601 date and time, and '
+                                 'delete the documents of publications that are no longer public, instead of '
+                                 'reading the change queue')
+        parser.add_argument('--loop', action='store_true', default=False,
+                            help='Keep polling the change queue instead of exiting after one batch')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds to sleep between polls of the change queue')
+
+    def handle(self, *args, **options):
+        if options['since']:
+            self.catch_up(options['since'])
+            return
+        while True:
+            publication_ids = search_index_changes.pop_ready()
+            if publication_ids:
+                logger.info('syncing search index documents of %s publications', len(publication_ids))
+                try:
+                    sync_publication_docs(publication_ids)
+                except Exception:
+                    search_index_changes.push(publication_ids)
+                    raise
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def catch_up(self, since):
+        watermark = parse_datetime(since)
+        if watermark is None:
+            raise CommandError('--since must be an ISO 8601 date and time, got {}'.format(since))
+        if timezone.is_naive(watermark):
+            watermark = timezone.make_aware(watermark)
+        publication_ids = get_changed_publication_ids(watermark)
+        publication_ids.update(get_unpublished_indexed_publication_ids())
+        indexed, deleted = sync_publication_docs(publication_ids)
+        self.stdout.write('Synced {} publications changed since {}: {} documents indexed, {} deleted'.format(
+            len(publication_ids), watermark.isoformat(), indexed, deleted))
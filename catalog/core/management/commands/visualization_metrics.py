@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from catalog.core import metrics
+from catalog.core.visualization.plot_cache import plot_cache
+
+HIT_RATE_METRICS = ['visualization.plot_cache', 'search.matched_ids_cache', 'visualization.timeseries_cube']
+
+
+class Command(BaseCommand):
+    help = '''Report the hit rates of the visualization caches accumulated by every worker'''
+
+    def handle(self, *args, **options):
+        for name, hit_rate in metrics.get_hit_rates(HIT_RATE_METRICS).items():
+            rate = 'n/a' if hit_rate['hit_rate'] is None else '{:.1%}'.format(hit_rate['hit_rate'])
+            self.stdout.write('{}: {} ({} hits, {} misses)'.format(name, rate, hit_rate['hits'], hit_rate['misses']))
+        if plot_cache.is_bounded:
+            for namespace, size in sorted(plot_cache.get_namespace_bytes().items()):
+                self.stdout.write('visualization.plot_cache.bytes.{}: {}'.format(namespace, size))
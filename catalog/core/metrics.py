@@ -0,0 +1,66 @@
+"""
+Lightweight counters and timings
+
+Values are logged and accumulated in the django cache under ``metrics:<name>`` so they are shared by every worker
+process and can be read back with ``get_metrics``.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+METRIC_KEY_PREFIX = 'metrics:'
+
+
+def _key(name):
+    return METRIC_KEY_PREFIX + name
+
+
+def incr(name, value=1):
+    key = _key(name)
+    cache.add(key, 0, None)
+    return cache.incr(key, value)
+
+
+def record_hit(name, hit):
+    incr('{}.{}'.format(name, 'hit' if hit else 'miss'))
+
+
+def gauge(name, value):
+    logger.info('%s: %s', name, value)
+    cache.set(_key(name), value, None)
+
+
+def timing(name, seconds):
+    """Record a duration as a call count and a total in milliseconds"""
+    logger.info('%s took %.3fs', name, seconds)
+    incr('{}.count'.format(name))
+    incr('{}.ms'.format(name), int(seconds * 1000))
+
+
+@contextmanager
+def timer(name):
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timing(name, time.monotonic() - start)
+
+
+def get_metrics(names):
+    values = cache.get_many([_key(name) for name in names])
+    return {name: values.get(_key(name), 0) for name in names}
+
+
+def get_hit_rates(names):
+    """Hits, misses and hit rate of each name counted by record_hit"""
+    values = get_metrics(['{}.{}'.format(name, outcome) for name in names for outcome in ('hit', 'miss')])
+    hit_rates = {}
+    for name in names:
+        hits, misses = values['{}.hit'.format(name)], values['{}.miss'.format(name)]
+        hit_rates[name] = {'hits': hits, 'misses': misses,
+                           'hit_rate': hits / (hits + misses) if hits + misses else None}
+    return hit_rates
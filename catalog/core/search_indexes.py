@@ -1,19 +1,46 @@
+import json
 import logging
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
 from urllib.parse import urlencode
 
+import numpy as np
+
+from django import db
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db.models import QuerySet
 from django.http import QueryDict
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from elasticsearch_dsl import analyzer, tokenizer
 from haystack import indexes
 from typing import Dict, List
 
 from citation.models import Publication, Platform, Sponsor, Tag, ModelDocumentation, Container, Author
+from . import metrics
+from .signals import publication_change_log
 
 logger = logging.getLogger(__name__)
 
+# hits fetched per scroll request when retrieving only the ids of the matching publications
+SCAN_IDS_PAGE_SIZE = 5000
+SCAN_IDS_SCROLL = '1m'
+SCAN_IDS_FILTER_PATH = ['_scroll_id', 'hits.hits.fields.id']
+
+# incremented every time the public search indices are rewritten, so pages rendered from them can be revalidated
+SEARCH_INDEX_GENERATION_KEY = 'search:generation'
+# ids of the publications matched by a search fingerprint, retired whenever the search index generation changes
+SEARCH_MATCHED_IDS_KEY = 'search:matched-ids:{generation}:{fingerprint}'
+SEARCH_MATCHED_IDS_LOCK_KEY = '{key}:lock'
+# seconds between checks for the ids being scanned by another request
+SEARCH_MATCHED_IDS_POLL_INTERVAL = 0.05
+
 
 ##########################################
 #  Publication query seach/filter index  #
@@ -105,11 +132,29 @@ def bulk_index_update():
 #           Public Indices               #
 ##########################################
 
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import BulkIndexError, parallel_bulk, streaming_bulk
 from elasticsearch_dsl import DocType, connections, InnerDoc, aggs, query
 import elasticsearch_dsl as edsl
 
 ALL_DATA_FIELD = 'all_data'
+# documents indexed between progress reports of a bulk index run
+BULK_INDEX_PROGRESS_INTERVAL = 10000
+PUBLICATION_DOC_PREFETCH = ('code_archive_urls', 'tags', 'sponsors', 'platforms', 'creators', 'model_documentation')
+
+
+def skip_empty(source):
+    """Drop the None, [] and {} values that DocType.to_dict leaves out of a document"""
+    return {key: value for key, value in source.items() if value is not None and value != [] and value != {}}
+
+
+def create_index_action(doc_class, id, source):
+    """Bulk index action for a document of doc_class, as doc_class(...).to_dict(include_meta=True) without building the
+    DSL objects"""
+    return {'_id': id, '_index': doc_class.Index.name, '_type': doc_class._doc_type.name, '_source': skip_empty(source)}
+
+
+def create_delete_action(doc_class, id):
+    return {'_op_type': 'delete', '_id': id, '_index': doc_class.Index.name, '_type': doc_class._doc_type.name}
 
 
 class AuthorInnerDoc(InnerDoc):
@@ -146,6 +191,84 @@ def normalize_search_querydict(qd: QueryDict):
     return search, filters
 
 
+def get_search_fingerprint(search, filters):
+    """Canonical key for the publications matched by a normalized search
+
+    Equal for queries that only differ in whitespace around search terms, parameter order, duplicate facet ids or
+    parameters the matches don't depend on, like page and content_type
+    """
+    canonical = json.dumps([' '.join(search.split()),
+                            {field_name: sorted(ids) for field_name, ids in sorted(filters.items()) if ids}])
+    return sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def get_search_index_generation():
+    return cache.get(SEARCH_INDEX_GENERATION_KEY)
+
+
+def bump_search_index_generation():
+    cache.add(SEARCH_INDEX_GENERATION_KEY, 0, None)
+    return cache.incr(SEARCH_INDEX_GENERATION_KEY)
+
+
+def encode_id_set(ids):
+    """Sorted unique ids as zlib compressed deltas between consecutive ids
+
+    Ids of matched publications are dense, so most deltas are small and the compressed set takes a few bits per id
+    instead of the pickled array's eight bytes.
+    """
+    deltas = np.diff(np.unique(np.asarray(ids, dtype=np.int64)), prepend=0)
+    return zlib.compress(deltas.astype('<u4').tobytes())
+
+
+def decode_id_set(data):
+    return np.cumsum(np.frombuffer(zlib.decompress(data), dtype='<u4'), dtype=np.int64)
+
+
+def get_matched_publication_ids(search, filters, fingerprint=None):
+    """Sorted ids of the publications matching a normalized search as an int64 array
+
+    Cached by the search fingerprint for SEARCH_MATCHED_IDS_TIMEOUT seconds so repeat requests for the same search
+    don't scan the index again until it is rewritten or synced. Only one request scans a missing search at a time, the
+    others, like the parallel plot requests of a visualization page, wait up to SEARCH_MATCHED_IDS_LOCK_TIMEOUT seconds
+    for its result.
+    """
+    if fingerprint is None:
+        fingerprint = get_search_fingerprint(search, filters)
+    key = SEARCH_MATCHED_IDS_KEY.format(generation=get_search_index_generation(), fingerprint=fingerprint)
+    data = cache.get(key)
+    metrics.record_hit('search.matched_ids_cache', data is not None)
+    if data is not None:
+        return decode_id_set(data)
+    lock_key = SEARCH_MATCHED_IDS_LOCK_KEY.format(key=key)
+    if not cache.add(lock_key, True, settings.SEARCH_MATCHED_IDS_LOCK_TIMEOUT):
+        with metrics.timer('search.matched_ids_cache.wait'):
+            deadline = time.monotonic() + settings.SEARCH_MATCHED_IDS_LOCK_TIMEOUT
+            while data is None and time.monotonic() < deadline:
+                time.sleep(SEARCH_MATCHED_IDS_POLL_INTERVAL)
+                # the ids are cached before the lock is released
+                scanning = cache.get(lock_key) is not None
+                data = cache.get(key)
+                if not scanning:
+                    break
+        if data is not None:
+            return decode_id_set(data)
+        # the scanning request failed or gave up, so scan without the lock instead of failing this request
+        metrics.incr('search.matched_ids_cache.wait_expired')
+        return _scan_matched_publication_ids(search, filters, key)
+    try:
+        return _scan_matched_publication_ids(search, filters, key)
+    finally:
+        cache.delete(lock_key)
+
+
+def _scan_matched_publication_ids(search, filters, key):
+    publication_ids = PublicationDocSearch().find(q=search, facet_filters=filters).scan_ids()
+    data = encode_id_set(publication_ids)
+    cache.set(key, data, settings.SEARCH_MATCHED_IDS_TIMEOUT)
+    return decode_id_set(data)
+
+
 class TopHits:
     def __init__(self, iterable, hits):
         self.iterable = iterable
@@ -290,6 +413,50 @@ class PublicationDocSearch:
     def scan(self):
         return self.search.scan()
 
+    def scan_ids(self, slices=None):
+        """Ids of every matching publication as an int64 array
+
+        Only the doc values of the id field are fetched and the responses are read as plain dicts, without building a
+        Hit per document. The scroll is split into slices scrolled concurrently.
+
+        :param slices: number of concurrent sliced scrolls, defaults to SEARCH_SCAN_IDS_SLICES
+        """
+        slices = settings.SEARCH_SCAN_IDS_SLICES if slices is None else slices
+        client = connections.get_connection(self.search._using)
+        index = self.search._index or PublicationDoc.Index.name
+        body = self.search.to_dict()
+        body.pop('from', None)
+        body.update(_source=False, docvalue_fields=['id'], sort=['_doc'], size=SCAN_IDS_PAGE_SIZE)
+
+        def scan_slice(slice_id):
+            slice_body = dict(body, slice={'id': slice_id, 'max': slices}) if slices > 1 else body
+            response = client.search(index=index, body=slice_body, scroll=SCAN_IDS_SCROLL,
+                                     filter_path=SCAN_IDS_FILTER_PATH)
+            scroll_id = response.get('_scroll_id')
+            pages = []
+            try:
+                while True:
+                    # filter_path drops hits entirely once a scroll is exhausted
+                    hits = response.get('hits', {}).get('hits')
+                    if not hits:
+                        break
+                    pages.append(np.fromiter((hit['fields']['id'][0] for hit in hits), dtype=np.int64,
+                                             count=len(hits)))
+                    response = client.scroll(scroll_id=scroll_id, scroll=SCAN_IDS_SCROLL,
+                                             filter_path=SCAN_IDS_FILTER_PATH)
+                    scroll_id = response.get('_scroll_id', scroll_id)
+            finally:
+                if scroll_id:
+                    client.clear_scroll(scroll_id=scroll_id, ignore=(404,))
+            return pages
+
+        if slices > 1:
+            with ThreadPoolExecutor(max_workers=slices, thread_name_prefix='search-scan') as executor:
+                pages = [page for slice_pages in executor.map(scan_slice, range(slices)) for page in slice_pages]
+        else:
+            pages = scan_slice(0)
+        return np.concatenate(pages) if pages else np.empty(0, dtype=np.int64)
+
     def agg_by_count(self):
         s = self.search._clone()
         for agg in self.aggs.values():
@@ -329,24 +496,24 @@ class PublicationDoc(DocType):
     @classmethod
     def from_instance(cls, publication):
         container = publication.container
-        doc = cls(meta={'id': publication.id},
-                  id=publication.id,
-                  title=publication.title,
-                  incomplete_date_published=publication.incomplete_date_published,
-                  last_modified=publication.date_modified,
-                  code_archive_urls=[CodeArchiveUrlInnerDoc(id=c.id, url=c.url, status=c.status)
-                                     for c in publication.code_archive_urls.all()],
-                  contact_email=publication.contact_email,
-                  container=ContainerInnerDoc(id=container.id, name=container.name, issn=container.issn),
-                  doi=publication.doi,
-                  tags=[RelatedInnerDoc(id=t.id, name=t.name) for t in publication.tags.all()],
-                  sponsors=[RelatedInnerDoc(id=s.id, name=s.name) for s in publication.sponsors.all()],
-                  platforms=[RelatedInnerDoc(id=p.id, name=p.name) for p in publication.platforms.all()],
-                  model_documentation=[md.name for md in publication.model_documentation.all()],
-                  authors=[
-                      AuthorInnerDoc(id=a.id, name=a.name, orcid=a.orcid, researcherid=a.researcherid, email=a.email)
-                      for a in publication.creators.all()])
-        return doc.to_dict(include_meta=True)
+        return create_index_action(cls, publication.id, {
+            'id': publication.id,
+            'title': publication.title,
+            'incomplete_date_published': publication.incomplete_date_published,
+            'last_modified': publication.date_modified,
+            'code_archive_urls': [skip_empty({'id': c.id, 'url': c.url, 'status': c.status})
+                                  for c in publication.code_archive_urls.all()],
+            'contact_email': publication.contact_email,
+            'container': skip_empty({'id': container.id, 'name': container.name, 'issn': container.issn}),
+            'doi': publication.doi,
+            'tags': [skip_empty({'id': t.id, 'name': t.name}) for t in publication.tags.all()],
+            'sponsors': [skip_empty({'id': s.id, 'name': s.name}) for s in publication.sponsors.all()],
+            'platforms': [skip_empty({'id': p.id, 'name': p.name}) for p in publication.platforms.all()],
+            'model_documentation': [md.name for md in publication.model_documentation.all()],
+            'authors': [skip_empty({'id': a.id, 'name': a.name, 'orcid': a.orcid, 'researcherid': a.researcherid,
+                                    'email': a.email})
+                        for a in publication.creators.all()],
+        })
 
     def get_public_detail_url(self):
         return reverse('core:public-publication-detail', kwargs={'pk': self.meta.id})
@@ -411,13 +578,9 @@ class AuthorDoc(DocType):
 
     @classmethod
     def from_instance(cls, author):
-        doc = cls(meta = {'id': author.id},
-                  id = author.id,
-                  orcid = author.orcid,
-                  researcherid = author.researcherid,
-                  email = author.email,
-                  name = author.name)
-        return doc.to_dict(include_meta=True)
+        return create_index_action(cls, author.id, {'id': author.id, 'orcid': author.orcid,
+                                                    'researcherid': author.researcherid, 'email': author.email,
+                                                    'name': author.name})
 
     class Index:
         name = 'author'
@@ -432,11 +595,8 @@ class ContainerDoc(DocType):
 
     @classmethod
     def from_instance(cls, container):
-        doc = cls(meta = {'id': container.id},
-                  id = container.id,
-                  name = container.name,
-                  issn = container.issn)
-        return doc.to_dict(include_meta=True)
+        return create_index_action(cls, container.id, {'id': container.id, 'name': container.name,
+                                                       'issn': container.issn})
 
     class Index:
         name = 'container'
@@ -450,10 +610,7 @@ class PlatformDoc(DocType):
 
     @classmethod
     def from_instance(cls, instance):
-        doc = cls(meta = {'id': instance.id},
-                  id = instance.id,
-                  name = instance.name)
-        return doc.to_dict(include_meta=True)
+        return create_index_action(cls, instance.id, {'id': instance.id, 'name': instance.name})
 
     class Index:
         name = 'platform'
@@ -467,10 +624,7 @@ class SponsorDoc(DocType):
 
     @classmethod
     def from_instance(cls, instance):
-        doc = cls(meta = {'id': instance.id},
-                  id = instance.id,
-                  name = instance.name)
-        return doc.to_dict(include_meta=True)
+        return create_index_action(cls, instance.id, {'id': instance.id, 'name': instance.name})
 
     class Index:
         name = 'sponsor'
@@ -482,29 +636,215 @@ class TagDoc(DocType):
 
     @classmethod
     def from_instance(cls, instance):
-        doc = cls(meta={'id': instance.id},
-                  id = instance.id,
-                  name = instance.name)
-        return doc.to_dict(include_meta=True)
+        return create_index_action(cls, instance.id, {'id': instance.id, 'name': instance.name})
 
     class Index:
         name = 'tag'
 
 
-def bulk_index_public():
+def close_db_connections_after(actions):
+    """Close the database connections of the thread that exhausts actions
+
+    parallel_bulk consumes actions from the task handler thread of its pool, which opens its own connection
+    """
+    try:
+        yield from actions
+    finally:
+        db.connections.close_all()
+
+
+def index_documents(client, name, actions, chunk_size, thread_count):
+    """Stream actions into elasticsearch with parallel_bulk, reporting progress and throughput"""
+    start = time.monotonic()
+    count = 0
+    for _ok, _info in parallel_bulk(client, close_db_connections_after(actions), thread_count=thread_count,
+                                    chunk_size=chunk_size):
+        count += 1
+        if count % BULK_INDEX_PROGRESS_INTERVAL == 0:
+            logger.info('indexed %s %s documents (%.0f docs/s)', count, name, count / (time.monotonic() - start))
+    elapsed = time.monotonic() - start
+    logger.info('indexed %s %s documents in %.1fs (%.0f docs/s)', count, name, elapsed,
+                count / elapsed if elapsed else 0)
+    metrics.timing('search_index.bulk.{}'.format(name), elapsed)
+    metrics.gauge('search_index.bulk.{}.documents'.format(name), count)
+    return count
+
+
+def create_versioned_index(doc_class, version):
+    """Create a new index for doc_class named after its alias and version, tuned for bulk loading
+
+    Refreshes are disabled and replicas are dropped until the load is finished by finish_versioned_index
+    """
+    index = doc_class._index.clone(name='{}-{}'.format(doc_class.Index.name, version))
+    index.settings(refresh_interval='-1', number_of_replicas=0)
+    index.create()
+    return index._name
+
+
+def finish_versioned_index(client, doc_class, index_name):
+    """Restore the refresh interval and replicas of a bulk loaded index and make its documents searchable"""
+    configured = getattr(doc_class.Index, 'settings', {})
+    client.indices.put_settings(index=index_name, body={'index': {
+        'refresh_interval': configured.get('refresh_interval'),
+        'number_of_replicas': configured.get('number_of_replicas'),
+    }})
+    client.indices.refresh(index=index_name)
+
+
+def swap_aliases(client, index_names):
+    """Atomically point every alias in index_names at its new index
+
+    Indices created before versioned reindexing are concrete indices named after the alias and are removed in the
+    same request
+    """
+    actions = []
+    for alias, index_name in index_names.items():
+        if client.indices.exists_alias(name=alias):
+            actions.extend({'remove': {'index': previous, 'alias': alias}}
+                           for previous in client.indices.get_alias(name=alias))
+        elif client.indices.exists(index=alias):
+            actions.append({'remove_index': {'index': alias}})
+        actions.append({'add': {'index': index_name, 'alias': alias}})
+    client.indices.update_aliases(body={'actions': actions})
+
+
+def prune_indices(client, alias, current_index_name):
+    """Delete the versioned indices of alias other than current_index_name"""
+    previous = [name for name in client.indices.get(index='{}-*'.format(alias)) if name != current_index_name]
+    if previous:
+        logger.info('deleting previous %s indices %s', alias, previous)
+        client.indices.delete(index=','.join(previous))
+
+
+def bulk_index_public(chunk_size=None, thread_count=None):
+    """Rebuild the public indices without interrupting searches
+
+    Every index is loaded into a new timestamped index, streaming every index concurrently, while the aliases named
+    after the indices keep serving the previous indices. The aliases are then swapped to the new indices at once, the
+    previous indices deleted and the publications changed since the rebuild started synced to the new indices.
+
+    :param chunk_size: documents per bulk request, defaults to SEARCH_INDEX_BULK_CHUNK_SIZE
+    :param thread_count: concurrent bulk requests for each index, defaults to SEARCH_INDEX_BULK_THREADS
+    """
+    chunk_size = settings.SEARCH_INDEX_BULK_CHUNK_SIZE if chunk_size is None else chunk_size
+    thread_count = settings.SEARCH_INDEX_BULK_THREADS if thread_count is None else thread_count
     client = connections.get_connection()
-    for doc_class in (PublicationDoc, AuthorDoc, PlatformDoc, SponsorDoc, TagDoc):
-        client.indices.delete(index=doc_class.Index.name, ignore=[400, 404])
-        doc_class.init()
     public_publications = Publication.api.primary().filter(status='REVIEWED')
-    bulk(client=client,
-         actions=(AuthorDoc.from_instance(a) for a in Author.objects.filter(publications__in=public_publications)))
-    bulk(client=client,
-         actions=(PlatformDoc.from_instance(p) for p in Platform.objects.filter(publications__in=public_publications)))
-    bulk(client=client,
-         actions=(SponsorDoc.from_instance(s) for s in Sponsor.objects.filter(publications__in=public_publications)))
-    bulk(client=client,
-         actions=(TagDoc.from_instance(t) for t in Tag.objects.filter(publications__in=public_publications)))
-    bulk(client=client,
-         actions=(PublicationDoc.from_instance(p) for p in public_publications.select_related('container') \
-         .prefetch_related('code_archive_urls', 'tags', 'sponsors', 'platforms', 'creators', 'model_documentation').iterator()))
+    # related entities are joined through their publications so each one is only fetched once with distinct
+    actions = {
+        AuthorDoc: (AuthorDoc.from_instance(a) for a in
+                    Author.objects.filter(publications__in=public_publications).distinct().iterator(chunk_size)),
+        ContainerDoc: (ContainerDoc.from_instance(c) for c in
+                       Container.objects.filter(pk__in=public_publications.values('container_id'))
+                       .iterator(chunk_size)),
+        PlatformDoc: (PlatformDoc.from_instance(p) for p in
+                      Platform.objects.filter(publications__in=public_publications).distinct().iterator(chunk_size)),
+        SponsorDoc: (SponsorDoc.from_instance(s) for s in
+                     Sponsor.objects.filter(publications__in=public_publications).distinct().iterator(chunk_size)),
+        TagDoc: (TagDoc.from_instance(t) for t in
+                 Tag.objects.filter(publications__in=public_publications).distinct().iterator(chunk_size)),
+        # iterator only prefetches related objects when it is given a chunk size
+        PublicationDoc: (PublicationDoc.from_instance(p) for p in public_publications.select_related('container')
+                         .prefetch_related(*PUBLICATION_DOC_PREFETCH).iterator(chunk_size)),
+    }
+    # the sync writes changes made while the new indices load to the previous indices, they are synced again after
+    # the swap
+    started_at = timezone.now()
+    version = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+    index_names = {}
+    try:
+        for doc_class in actions:
+            index_names[doc_class] = create_versioned_index(doc_class, version)
+        with ThreadPoolExecutor(max_workers=len(actions), thread_name_prefix='search-index') as executor:
+            futures = [executor.submit(index_documents, client, doc_class.Index.name,
+                                       (dict(action, _index=index_names[doc_class]) for action in doc_actions),
+                                       chunk_size, thread_count)
+                       for doc_class, doc_actions in actions.items()]
+            for future in futures:
+                future.result()
+        for doc_class, index_name in index_names.items():
+            finish_versioned_index(client, doc_class, index_name)
+    except Exception:
+        logger.exception('rebuilding the public indices failed, the aliases still point at the previous indices')
+        if index_names:
+            client.indices.delete(index=','.join(index_names.values()), ignore=[404])
+        raise
+    swap_aliases(client, {doc_class.Index.name: index_name for doc_class, index_name in index_names.items()})
+    logger.info('swapped the public index aliases to %s', sorted(index_names.values()))
+    for doc_class, index_name in index_names.items():
+        prune_indices(client, doc_class.Index.name, index_name)
+    bump_search_index_generation()
+    # changes to related rows that leave no date_modified are recorded in the publication change log
+    publication_ids = set(Publication.objects.filter(date_modified__gte=started_at).values_list('id', flat=True))
+    publication_ids.update(publication_change_log.changed_since(started_at))
+    publication_ids.update(get_unpublished_indexed_publication_ids())
+    if publication_ids:
+        logger.info('syncing %s publications changed during the rebuild', len(publication_ids))
+        sync_publication_docs(publication_ids, chunk_size)
+
+
+def get_publication_sync_actions(publication_ids, chunk_size):
+    """Bulk actions bringing the documents of publication_ids up to date with the database
+
+    Publications are serialized in batches of chunk_size with their related objects prefetched. Public publications
+    are indexed again along with their authors, container, platforms, sponsors and tags, the others are deleted.
+    """
+    publication_ids = sorted(publication_ids)
+    for start in range(0, len(publication_ids), chunk_size):
+        batch = publication_ids[start:start + chunk_size]
+        publications = list(Publication.api.primary().filter(status='REVIEWED', id__in=batch)
+                            .select_related('container').prefetch_related(*PUBLICATION_DOC_PREFETCH))
+        for publication_id in sorted(set(batch).difference(p.id for p in publications)):
+            yield create_delete_action(PublicationDoc, publication_id)
+        related = {}
+        for publication in publications:
+            yield PublicationDoc.from_instance(publication)
+            related[(ContainerDoc, publication.container.id)] = publication.container
+            for doc_class, instances in ((AuthorDoc, publication.creators), (PlatformDoc, publication.platforms),
+                                         (SponsorDoc, publication.sponsors), (TagDoc, publication.tags)):
+                related.update(((doc_class, instance.id), instance) for instance in instances.all())
+        for (doc_class, _field), instance in related.items():
+            yield doc_class.from_instance(instance)
+
+
+def sync_publication_docs(publication_ids, chunk_size=None):
+    """Upsert or delete the documents of the given publications through the index aliases
+
+    Related documents that are no longer referenced by a public publication are left for the next full rebuild.
+
+    :param chunk_size: publications serialized and documents sent per bulk request, defaults to
+    SEARCH_INDEX_BULK_CHUNK_SIZE
+    :return: number of indexed and deleted documents
+    """
+    chunk_size = settings.SEARCH_INDEX_BULK_CHUNK_SIZE if chunk_size is None else chunk_size
+    client = connections.get_connection()
+    counts = Counter()
+    errors = []
+    for ok, item in streaming_bulk(client, get_publication_sync_actions(publication_ids, chunk_size),
+                                   chunk_size=chunk_size, raise_on_error=False):
+        op_type, result = next(iter(item.items()))
+        # publications that were never public have no document to delete
+        if ok or (op_type == 'delete' and result.get('status') == 404):
+            counts[op_type] += 1
+        else:
+            errors.append(item)
+    logger.info('synced %s publications: %s indexed, %s deleted, %s failed', len(publication_ids),
+                counts['index'], counts['delete'], len(errors))
+    if counts:
+        bump_search_index_generation()
+    if errors:
+        raise BulkIndexError('{} document(s) failed to sync'.format(len(errors)), errors)
+    return counts['index'], counts['delete']
+
+
+def get_indexed_publication_ids():
+    return set(PublicationDocSearch().scan_ids().tolist())
+
+
+def get_unpublished_indexed_publication_ids():
+    """Ids of indexed publications that are no longer public
+
+    Deleted publications leave no modification time behind so they are found by comparing the index with the database
+    """
+    public_ids = set(Publication.api.primary().filter(status='REVIEWED').values_list('id', flat=True))
+    return get_indexed_publication_ids().difference(public_ids)
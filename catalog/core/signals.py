@@ -0,0 +1,94 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from citation.models import (Publication, PublicationAuthors, PublicationPlatforms, PublicationSponsors,
+                             PublicationTags, CodeArchiveUrl, Author, Container, Platform, Sponsor, Tag)
+from .delta import DeltaQueue, PublicationChangeLog
+
+logger = logging.getLogger(__name__)
+
+visualization_changes = DeltaQueue('visualization', debounce=settings.VISUALIZATION_DELTA_DEBOUNCE)
+search_index_changes = DeltaQueue('search-index', debounce=settings.SEARCH_INDEX_DELTA_DEBOUNCE)
+publication_change_log = PublicationChangeLog('publications', retention=settings.PUBLICATION_CHANGE_LOG_RETENTION)
+
+# queues that receive the ids of publications whose public data changed
+PUBLICATION_CHANGE_QUEUES = [visualization_changes, search_index_changes]
+
+# related models whose rows belong to a single publication
+PUBLICATION_RELATED_MODELS = (PublicationAuthors, PublicationPlatforms, PublicationSponsors, PublicationTags,
+                              CodeArchiveUrl)
+
+# shared models and the Publication lookup for the publications that display them
+SHARED_MODEL_LOOKUPS = {
+    Author: 'creators',
+    Container: 'container',
+    Platform: 'platforms',
+    Sponsor: 'sponsors',
+    Tag: 'tags',
+}
+
+PUBLICATION_M2M_FIELDS = ('creators', 'model_documentation', 'platforms', 'sponsors', 'tags')
+
+
+def enqueue_publication_changes(publication_ids, log=True):
+    """Add publication ids to every change queue once the current transaction commits
+
+    :param log: also record the change in the publication change log, so changes that leave no date_modified of their
+    own, like deleted through rows or renamed authors, are seen by the watermarks and the detail page ETag
+    """
+    publication_ids = {publication_id for publication_id in publication_ids if publication_id is not None}
+    if publication_ids:
+        transaction.on_commit(lambda: _push_publication_changes(publication_ids, log))
+
+
+def _push_publication_changes(publication_ids, log):
+    for queue in PUBLICATION_CHANGE_QUEUES:
+        queue.push(publication_ids)
+    if log:
+        publication_change_log.record(publication_ids)
+
+
+def publication_changed(sender, instance, **kwargs):
+    # saving a publication already updates its date_modified
+    enqueue_publication_changes([instance.pk], log=False)
+
+
+def publication_related_changed(sender, instance, **kwargs):
+    enqueue_publication_changes([instance.publication_id])
+
+
+def shared_model_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    lookup = SHARED_MODEL_LOOKUPS[sender]
+    enqueue_publication_changes(Publication.objects.filter(**{lookup: instance}).values_list('id', flat=True))
+
+
+def publication_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # the publications losing a shared row are only known before its through rows are deleted
+        field_name = next(name for name in PUBLICATION_M2M_FIELDS if getattr(Publication, name).through is sender)
+        enqueue_publication_changes(Publication.objects.filter(**{field_name: instance}).values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        enqueue_publication_changes([instance.pk])
+    elif pk_set:
+        enqueue_publication_changes(pk_set)
+
+
+def connect_signals():
+    for signal in (post_save, post_delete):
+        signal.connect(publication_changed, sender=Publication, dispatch_uid='publication_changed')
+        for model in PUBLICATION_RELATED_MODELS:
+            signal.connect(publication_related_changed, sender=model,
+                           dispatch_uid='publication_related_changed_{}'.format(model.__name__))
+    for model in SHARED_MODEL_LOOKUPS:
+        post_save.connect(shared_model_changed, sender=model,
+                          dispatch_uid='shared_model_changed_{}'.format(model.__name__))
+    for field_name in PUBLICATION_M2M_FIELDS:
+        m2m_changed.connect(publication_m2m_changed, sender=getattr(Publication, field_name).through,
+                            dispatch_uid='publication_m2m_changed_{}'.format(field_name))
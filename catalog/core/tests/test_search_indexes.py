@@ -0,0 +1,217 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.http import QueryDict
+from django.test import SimpleTestCase, override_settings
+from elasticsearch.helpers import BulkIndexError
+
+from catalog.core.management.commands import sync_search_index
+from catalog.core.search_indexes import (SEARCH_MATCHED_IDS_KEY, SEARCH_MATCHED_IDS_LOCK_KEY, AuthorDoc,
+                                         PublicationDoc, PublicationDocSearch, TagDoc, create_delete_action,
+                                         create_versioned_index, decode_id_set, encode_id_set,
+                                         get_matched_publication_ids, get_publication_sync_actions,
+                                         get_search_fingerprint, normalize_search_querydict, prune_indices,
+                                         swap_aliases, sync_publication_docs)
+
+
+class PublicationSyncActionsTest(SimpleTestCase):
+    @patch('catalog.core.search_indexes.Publication')
+    def test_publications_that_are_not_public_are_deleted(self, publication_model):
+        publication_model.api.primary.return_value.filter.return_value.select_related.return_value \
+            .prefetch_related.return_value = []
+        actions = list(get_publication_sync_actions({8, 3}, chunk_size=500))
+        self.assertEqual(actions, [create_delete_action(PublicationDoc, 3), create_delete_action(PublicationDoc, 8)])
+        self.assertEqual({action['_op_type'] for action in actions}, {'delete'})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   SEARCH_INDEX_BULK_CHUNK_SIZE=500)
+@patch('catalog.core.search_indexes.connections.get_connection')
+@patch('catalog.core.search_indexes.get_publication_sync_actions')
+class SyncPublicationDocsTest(SimpleTestCase):
+    def sync(self, results):
+        with patch('catalog.core.search_indexes.streaming_bulk', return_value=iter(results)):
+            return sync_publication_docs({3, 5, 8})
+
+    def test_missing_document_of_a_deleted_publication_is_counted(self, get_publication_sync_actions,
+                                                                  get_connection):
+        self.assertEqual(self.sync([(True, {'index': {'_id': 3, 'status': 200}}),
+                                    (False, {'delete': {'_id': 5, 'status': 404}}),
+                                    (True, {'delete': {'_id': 8, 'status': 200}})]), (1, 2))
+
+    def test_failures_raise(self, get_publication_sync_actions, get_connection):
+        with self.assertRaises(BulkIndexError) as raised:
+            self.sync([(True, {'index': {'_id': 3, 'status': 200}}),
+                       (False, {'index': {'_id': 5, 'status': 400, 'error': 'mapper_parsing_exception'}})])
+        self.assertEqual(raised.exception.errors, [{'index': {'_id': 5, 'status': 400,
+                                                              'error': 'mapper_parsing_exception'}}])
+
+
+class SyncSearchIndexCommandTest(SimpleTestCase):
+    def test_since_must_be_a_date_and_time(self):
+        with self.assertRaises(CommandError):
+            call_command(sync_search_index.Command(), since='last tuesday')
+
+    @patch.object(sync_search_index, 'sync_publication_docs', side_effect=BulkIndexError('1 document(s) failed', []))
+    @patch.object(sync_search_index.search_index_changes, 'push')
+    @patch.object(sync_search_index.search_index_changes, 'pop_ready', return_value={3, 5})
+    def test_failed_sync_requeues_the_changes(self, pop_ready, push, sync_publication_docs):
+        with self.assertRaises(BulkIndexError):
+            call_command(sync_search_index.Command())
+        sync_publication_docs.assert_called_once_with({3, 5})
+        push.assert_called_once_with({3, 5})
+
+
+class SearchFingerprintTest(SimpleTestCase):
+    def get_fingerprint(self, query_string):
+        return get_search_fingerprint(*normalize_search_querydict(QueryDict(query_string)))
+
+    def test_equivalent_queries(self):
+        fingerprint = self.get_fingerprint('search=agent+model&sponsors=3&sponsors=1&platforms=2')
+        self.assertEqual(self.get_fingerprint('platforms=2&sponsors=1&sponsors=3&sponsors=1&search=agent++model+'),
+                         fingerprint)
+        self.assertEqual(self.get_fingerprint('search=agent+model&sponsors=1&sponsors=3&platforms=2&page=4'
+                                              '&content_type=authors'), fingerprint)
+
+    def test_different_queries(self):
+        fingerprint = self.get_fingerprint('search=agent&sponsors=1')
+        self.assertNotEqual(self.get_fingerprint('search=agent&platforms=1'), fingerprint)
+        self.assertNotEqual(self.get_fingerprint('search=Agent&sponsors=1'), fingerprint)
+        self.assertNotEqual(self.get_fingerprint('sponsors=1'), fingerprint)
+
+
+class IndexActionTest(SimpleTestCase):
+    def test_actions_match_document_serialization(self):
+        author = SimpleNamespace(id=4, orcid=None, researcherid='', email='grimm@example.org', name='Grimm')
+        self.assertEqual(AuthorDoc.from_instance(author),
+                         AuthorDoc(meta={'id': 4}, id=4, orcid=None, researcherid='', email='grimm@example.org',
+                                   name='Grimm').to_dict(include_meta=True))
+        self.assertEqual(TagDoc.from_instance(SimpleNamespace(id=2, name=None)),
+                         TagDoc(meta={'id': 2}, id=2, name=None).to_dict(include_meta=True))
+
+
+class FakeScrollClient:
+    """Serves the ids of each slice two per page"""
+
+    def __init__(self, slice_ids):
+        self.slice_ids = slice_ids
+        self.pages = {}
+        self.cleared = []
+
+    def _page(self, scroll_id):
+        page = self.pages[scroll_id]
+        self.pages[scroll_id] = page[2:]
+        response = {'_scroll_id': scroll_id}
+        if page[:2]:
+            response['hits'] = {'hits': [{'fields': {'id': [pk]}} for pk in page[:2]]}
+        return response
+
+    def search(self, index, body, **kwargs):
+        slice_id = body['slice']['id'] if 'slice' in body else 0
+        scroll_id = 'slice-{}'.format(slice_id)
+        self.pages[scroll_id] = list(self.slice_ids[slice_id])
+        return self._page(scroll_id)
+
+    def scroll(self, scroll_id, **kwargs):
+        return self._page(scroll_id)
+
+    def clear_scroll(self, scroll_id, **kwargs):
+        self.cleared.append(scroll_id)
+
+
+class ScanIdsTest(SimpleTestCase):
+    def test_ids_of_every_slice_are_returned(self):
+        client = FakeScrollClient([[3, 5, 8], [13, 21]])
+        with patch('catalog.core.search_indexes.connections.get_connection', return_value=client):
+            publication_ids = PublicationDocSearch().scan_ids(slices=2)
+        self.assertEqual(publication_ids.dtype, np.int64)
+        self.assertEqual(sorted(publication_ids.tolist()), [3, 5, 8, 13, 21])
+        self.assertEqual(sorted(client.cleared), ['slice-0', 'slice-1'])
+
+    def test_no_matches(self):
+        client = FakeScrollClient([[]])
+        with patch('catalog.core.search_indexes.connections.get_connection', return_value=client):
+            self.assertEqual(PublicationDocSearch().scan_ids(slices=1).tolist(), [])
+
+
+class VersionedIndexTest(SimpleTestCase):
+    def test_create_versioned_index(self):
+        client = MagicMock()
+        with patch('elasticsearch_dsl.connections.connections.get_connection', return_value=client):
+            index_name = create_versioned_index(TagDoc, '20240101000000')
+        self.assertEqual(index_name, '{}-20240101000000'.format(TagDoc.Index.name))
+        client.indices.create.assert_called_once()
+        self.assertEqual(client.indices.create.call_args.kwargs['index'], index_name)
+        self.assertEqual(client.indices.create.call_args.kwargs['body']['settings'],
+                         {'refresh_interval': '-1', 'number_of_replicas': 0})
+
+    def test_swap_aliases(self):
+        client = MagicMock()
+        client.indices.exists_alias.side_effect = lambda name: name == 'tag'
+        client.indices.get_alias.return_value = {'tag-20230101000000': {'aliases': {'tag': {}}}}
+        client.indices.exists.return_value = True
+        swap_aliases(client, {'tag': 'tag-20240101000000', 'author': 'author-20240101000000'})
+        client.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'remove': {'index': 'tag-20230101000000', 'alias': 'tag'}},
+            {'add': {'index': 'tag-20240101000000', 'alias': 'tag'}},
+            # indices created before versioned reindexing are concrete indices named after the alias
+            {'remove_index': {'index': 'author'}},
+            {'add': {'index': 'author-20240101000000', 'alias': 'author'}},
+        ]})
+
+    def test_prune_indices(self):
+        client = MagicMock()
+        client.indices.get.return_value = {'tag-20220101000000': {}, 'tag-20230101000000': {},
+                                           'tag-20240101000000': {}}
+        prune_indices(client, 'tag', 'tag-20240101000000')
+        client.indices.get.assert_called_once_with(index='tag-*')
+        client.indices.delete.assert_called_once_with(index='tag-20220101000000,tag-20230101000000')
+
+    def test_prune_indices_keeps_current_index(self):
+        client = MagicMock()
+        client.indices.get.return_value = {'tag-20240101000000': {}}
+        prune_indices(client, 'tag', 'tag-20240101000000')
+        client.indices.delete.assert_not_called()
+
+
+class IdSetEncodingTest(SimpleTestCase):
+    def test_round_trip(self):
+        self.assertEqual(decode_id_set(encode_id_set(np.array([21, 3, 8, 3, 100000]))).tolist(), [3, 8, 21, 100000])
+        self.assertEqual(decode_id_set(encode_id_set([])).dtype, np.int64)
+        self.assertEqual(decode_id_set(encode_id_set([])).tolist(), [])
+
+    def test_dense_ids_are_compact(self):
+        self.assertLess(len(encode_id_set(np.arange(1, 20001))), 1000)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   SEARCH_MATCHED_IDS_TIMEOUT=60, SEARCH_MATCHED_IDS_LOCK_TIMEOUT=5)
+class MatchedPublicationIdsTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.scans = []
+
+    def scan_ids(self, publication_doc_search, slices=None):
+        self.scans.append(slices)
+        time.sleep(0.2)
+        return np.array([8, 3])
+
+    def test_concurrent_requests_scan_once(self):
+        with patch.object(PublicationDocSearch, 'scan_ids', autospec=True, side_effect=self.scan_ids):
+            with ThreadPoolExecutor(max_workers=7) as executor:
+                results = list(executor.map(lambda _: get_matched_publication_ids('abm', {}).tolist(), range(7)))
+        self.assertEqual(results, [[3, 8]] * 7)
+        self.assertEqual(len(self.scans), 1)
+
+    @override_settings(SEARCH_MATCHED_IDS_LOCK_TIMEOUT=0.2)
+    def test_abandoned_scan_is_not_waited_on_forever(self):
+        key = SEARCH_MATCHED_IDS_KEY.format(generation=None, fingerprint=get_search_fingerprint('abm', {}))
+        cache.add(SEARCH_MATCHED_IDS_LOCK_KEY.format(key=key), True, 60)
+        with patch.object(PublicationDocSearch, 'scan_ids', autospec=True, side_effect=self.scan_ids):
+            self.assertEqual(get_matched_publication_ids('abm', {}).tolist(), [3, 8])
+        self.assertEqual(len(self.scans), 1)
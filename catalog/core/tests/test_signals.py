@@ -0,0 +1,104 @@
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from citation.models import Publication, PublicationTags, Tag
+from catalog.core.delta import DeltaQueue, PublicationChangeLog
+from catalog.core.signals import PUBLICATION_CHANGE_QUEUES, publication_change_log
+from catalog.core.visualization.data_access import get_changed_publication_ids, get_publication_last_modified
+from .common import BaseTest
+
+
+class DeltaQueueTest(SimpleTestCase):
+    def setUp(self):
+        self.queue = DeltaQueue('test', debounce=10)
+        self.queue.connection.delete(self.queue.key)
+        self.addCleanup(self.queue.connection.delete, self.queue.key)
+
+    def test_ids_are_ready_once_left_alone(self):
+        self.queue.push([3, 5], timestamp=time.time() - 20)
+        self.queue.push([8])
+        self.assertEqual(self.queue.pop_ready(), {3, 5})
+        self.assertEqual(self.queue.pop_ready(), set())
+        self.assertEqual(len(self.queue), 1)
+
+    def test_repeated_changes_are_debounced(self):
+        self.queue.push([3], timestamp=time.time() - 20)
+        self.queue.push([3])
+        self.assertEqual(self.queue.pop_ready(), set())
+        self.assertEqual(len(self.queue), 1)
+
+
+class PublicationChangeLogTest(SimpleTestCase):
+    def setUp(self):
+        self.change_log = PublicationChangeLog('test', retention=60)
+        self.change_log.connection.delete(self.change_log.key)
+        self.addCleanup(self.change_log.connection.delete, self.change_log.key)
+
+    def test_changes_since(self):
+        now = time.time()
+        self.change_log.record([3, 5], timestamp=now - 20)
+        self.change_log.record([5])
+        self.assertEqual(self.change_log.changed_since(datetime.fromtimestamp(now - 30, tz=timezone.utc)), {3, 5})
+        self.assertEqual(self.change_log.changed_since(datetime.fromtimestamp(now - 10, tz=timezone.utc)), {5})
+        self.assertGreater(self.change_log.last_changed(5), self.change_log.last_changed(3))
+        self.assertEqual(self.change_log.latest(), self.change_log.last_changed(5))
+        self.assertIsNone(self.change_log.last_changed(8))
+
+    def test_expired_changes_are_dropped(self):
+        self.change_log.record([3], timestamp=time.time() - 120)
+        self.change_log.record([5])
+        self.assertEqual(self.change_log.changed_since(datetime.fromtimestamp(0, tz=timezone.utc)), {5})
+
+
+TEST_CHANGE_LOG_KEY = 'catalog:changes:test'
+
+
+@patch.object(DeltaQueue, 'push')
+@patch.object(publication_change_log, 'key', TEST_CHANGE_LOG_KEY)
+class PublicationChangeTrackingTest(BaseTest):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(publication_change_log.connection.delete, TEST_CHANGE_LOG_KEY)
+        container = self.create_container(name='Ecological Modelling')
+        container.save()
+        self.publication = self.create_publication(title='An agent based model', added_by=self.user,
+                                                   container=container)
+        self.publication.save()
+        self.tag = Tag.objects.create(name='ecology')
+        PublicationTags.objects.create(publication=self.publication, tag=self.tag)
+        self.since = Publication.objects.get(pk=self.publication.pk).date_modified
+
+    def test_deleted_through_row_is_a_change(self, push):
+        with self.captureOnCommitCallbacks(execute=True):
+            PublicationTags.objects.filter(publication=self.publication, tag=self.tag).delete()
+        self.assertEqual(get_changed_publication_ids(self.since), {self.publication.pk})
+
+    def test_renamed_tag_is_a_change(self, push):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'landscape ecology'
+            self.tag.save()
+        self.assertEqual(get_changed_publication_ids(self.since), {self.publication.pk})
+
+    def test_cleared_tag_is_a_change(self, push):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.publications.clear()
+        self.assertEqual(get_changed_publication_ids(self.since), {self.publication.pk})
+
+    def test_untimestamped_change_leaves_date_modified_alone(self, push):
+        with self.captureOnCommitCallbacks(execute=True):
+            PublicationTags.objects.filter(publication=self.publication, tag=self.tag).delete()
+        self.assertEqual(Publication.objects.get(pk=self.publication.pk).date_modified, self.since)
+        self.assertGreater(get_publication_last_modified(self.publication.pk), self.since)
+
+    def test_changes_are_pushed_to_every_queue_on_commit(self, push):
+        with self.captureOnCommitCallbacks(execute=True):
+            PublicationTags.objects.filter(publication=self.publication, tag=self.tag).delete()
+            push.assert_not_called()
+        self.assertEqual([call.args[0] for call in push.call_args_list], PUBLICATION_CHANGE_QUEUES)
+        self.assertTrue(all(call.args[1] == {self.publication.pk} for call in push.call_args_list))
+
+    def test_unchanged_publication(self, push):
+        self.assertEqual(get_changed_publication_ids(self.since), set())
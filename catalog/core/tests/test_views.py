@@ -3,10 +3,15 @@ import logging
 from unittest import mock
 from unittest.mock import patch
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
 from haystack.query import SearchQuerySet
 
-from citation.models import Publication
+from citation.models import Publication, PublicationTags, Tag
+from catalog.core.delta import DeltaQueue
+from catalog.core.signals import publication_change_log
+from catalog.core.views import get_canonical_query, with_conditional_get
 from .common import BaseTest
 
 logger = logging.getLogger(__name__)
@@ -18,6 +23,7 @@ DASHBOARD_URL = 'core:dashboard'
 HAYSTACK_SEARCH_URL = 'core:haystack_search'
 PUBLICATIONS_URL = 'citation:publications'
 PUBLICATION_DETAIL_URL = 'citation:publication_detail'
+PUBLIC_PUBLICATION_DETAIL_URL = 'core:public-publication-detail'
 USER_PROFILE_URL = 'core:user_profile'
 WORKFLOW_URL = 'core:curator_workflow'
 HOME_URL = 'core:public-home'
@@ -154,6 +160,27 @@ class PublicationDetailViewTest(BaseTest):
             'format': 'json'}, kwargs={'pk': 999999})
         self.without_login_and_with_login_test(url, after_status=404)
 
+    @patch.object(DeltaQueue, 'push')
+    @patch.object(publication_change_log, 'key', 'catalog:changes:test')
+    def test_public_publication_detail_etag_changes_when_a_tag_is_removed(self, push):
+        self.addCleanup(publication_change_log.connection.delete, publication_change_log.key)
+        container = self.create_container(name='Econometrica')
+        container.save()
+        p = self.create_publication(title='A very model model', added_by=self.user, container=container,
+                                    status=Publication.Status.REVIEWED)
+        p.save()
+        tag = Tag.objects.create(name='ecology')
+        PublicationTags.objects.create(publication=p, tag=tag)
+
+        url = self.reverse(PUBLIC_PUBLICATION_DETAIL_URL, kwargs={'pk': p.pk})
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            PublicationTags.objects.filter(publication=p, tag=tag).delete()
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
     @patch('citation.views.PublicationSerializer')
     def test_publication_detail_save_uses_publication_serializer(self, publication_serializer):
         class MockPublicationSerializer:
@@ -250,3 +277,31 @@ class ContactViewTest(BaseTest):
         data.assert_any_call()
         is_valid.assert_any_call()
         save.assert_any_call()
+
+
+class ConditionalGetTest(SimpleTestCase):
+    def setUp(self):
+        self.generation = 1
+        self.view = with_conditional_get(lambda request: [self.generation])(lambda request: HttpResponse('page'))
+
+    def get(self, query, etag=None):
+        headers = {} if etag is None else {'HTTP_IF_NONE_MATCH': etag}
+        request = RequestFactory().get('/publications/', query, **headers)
+        request.user = AnonymousUser()
+        return self.view(request)
+
+    def test_canonical_query(self):
+        factory = RequestFactory()
+        self.assertEqual(get_canonical_query(factory.get('/', {'search': ' agent  based', 'tags': ['2', '1']}).GET),
+                         get_canonical_query(factory.get('/', {'tags': ['1', '2', '1'], 'search': 'agent based'}).GET))
+        self.assertNotEqual(get_canonical_query(factory.get('/', {'page': '1'}).GET),
+                            get_canonical_query(factory.get('/', {'page': '2'}).GET))
+
+    def test_repeat_request_is_not_modified(self):
+        response = self.get({'search': 'abm'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('stale-while-revalidate', response['Cache-Control'])
+        self.assertEqual(self.get({'search': 'abm'}, response['ETag']).status_code, 304)
+        self.assertEqual(self.get({'search': 'ibm'}, response['ETag']).status_code, 200)
+        self.generation = 2
+        self.assertEqual(self.get({'search': 'abm'}, response['ETag']).status_code, 200)
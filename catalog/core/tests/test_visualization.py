@@ -0,0 +1,468 @@
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from citation.models import Publication
+from catalog.core.visualization.aggregation import EntityCodes, VisualizationAggregator, create_entity_codes
+from catalog.core.visualization.cube import TimeseriesCube
+from catalog.core.visualization.data_access import (VISUALIZATION_CACHE_GENERATION_COUNTER_KEY,
+                                                    VISUALIZATION_CACHE_GENERATION_KEY,
+                                                    VISUALIZATION_CACHE_RETIRED_GENERATIONS_KEY, VisualizationCache,
+                                                    build_many, compact_related_df, upsert_related_df)
+from catalog.core.visualization.figures import FigureTemplate, PlotJSONEncoder
+from catalog.core.visualization.plot_cache import (VISUALIZATION_PLOT_BYTES_KEY, VISUALIZATION_PLOT_ENTRIES_KEY,
+                                                   VISUALIZATION_PLOT_LRU_KEY, VISUALIZATION_PLOT_MISSES_KEY,
+                                                   PlotCache)
+from catalog.core.visualization.position_index import PublicationPositionIndex
+from catalog.core.visualization.snapshot import ColumnarSnapshot
+
+# the default cache under a key prefix of its own, so tests never touch the keys of a running catalog
+TEST_CACHES = {'default': dict(settings.CACHES['default'], KEY_PREFIX='test')}
+
+
+def create_publication_df():
+    df = pd.DataFrame.from_records([
+        {'id': 3, 'container_id': 10, 'container_name': 'Ecological Modelling', 'date_published': date(2001, 5, 1),
+         'year_published': 2001.0, 'has_available_code': True, 'has_odd': False, 'status': 'REVIEWED',
+         'title': 'An agent based model'},
+        {'id': 5, 'container_id': 11, 'container_name': 'JASSS', 'date_published': None,
+         'year_published': None, 'has_available_code': False, 'has_odd': True, 'status': 'REVIEWED',
+         'title': 'An individual based model'},
+        {'id': 8, 'container_id': 10, 'container_name': 'Ecological Modelling', 'date_published': date(2010, 1, 1),
+         'year_published': 2010.0, 'has_available_code': False, 'has_odd': True, 'status': 'REVIEWED',
+         'title': None},
+    ], index='id')
+    for column in ('has_flow_charts', 'has_math_description', 'has_pseudocode'):
+        df[column] = False
+    return df
+
+
+class ColumnarSnapshotTest(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.snapshot = ColumnarSnapshot(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_read_many_without_snapshot(self):
+        self.assertEqual(self.snapshot.read_many({'publications'}), {})
+
+    def test_round_trip(self):
+        publication_df = create_publication_df()
+        self.snapshot.write({'publications': publication_df})
+        df = self.snapshot.read_many({'publications'})['publications']
+        self.assertEqual(list(df.index), [3, 5, 8])
+        self.assertEqual(list(df.columns), list(publication_df.columns))
+        self.assertEqual(list(df['container_name']), list(publication_df['container_name']))
+        self.assertTrue(pd.isnull(df.loc[8, 'title']))
+        self.assertEqual(df['has_available_code'].sum(), 1)
+        self.assertEqual(df['year_published'].max(), 2010.0)
+
+    def test_read_selected_columns(self):
+        self.snapshot.write({'publications': create_publication_df()})
+        df = self.snapshot.read_many({'publications'}, columns={'publications': ['year_published', 'has_odd']})[
+            'publications']
+        self.assertEqual(list(df.columns), ['year_published', 'has_odd'])
+
+    def test_round_trip_compacted(self):
+        publication_df = compact_related_df('publications', create_publication_df())
+        self.snapshot.write({'publications': publication_df})
+        df = self.snapshot.read_many({'publications'})['publications']
+        self.assertEqual(str(df['year_published'].dtype), 'Int16')
+        self.assertTrue(pd.isnull(df.loc[5, 'year_published']))
+        self.assertEqual(df.loc[8, 'year_published'], 2010)
+        self.assertEqual(df['container_id'].dtype, 'int32')
+
+    def test_columns_share_the_mapped_files(self):
+        self.snapshot.write({'publications': compact_related_df('publications', create_publication_df())})
+        mapped = []
+        np_load = np.load
+
+        def load(*args, **kwargs):
+            values = np_load(*args, **kwargs)
+            mapped.append(values)
+            return values
+
+        with patch('catalog.core.visualization.snapshot.np.load', side_effect=load):
+            df = self.snapshot.read_many({'publications'})['publications']
+        for column in ('container_id', 'has_odd'):
+            self.assertTrue(any(np.shares_memory(df[column].to_numpy(), values) for values in mapped), column)
+        self.assertTrue(any(np.shares_memory(df['container_name'].array.codes, values) for values in mapped))
+        self.assertTrue(any(np.shares_memory(df['year_published'].array._data, values) for values in mapped))
+
+    def test_new_snapshot_replaces_current(self):
+        publication_df = create_publication_df()
+        self.snapshot.write({'publications': publication_df})
+        self.snapshot.read_many({'publications'})
+        self.snapshot.write({'publications': publication_df.iloc[:1]})
+        df = self.snapshot.read_many({'publications'})['publications']
+        self.assertEqual(list(df.index), [3])
+
+    def test_snapshot_of_another_generation_is_not_read(self):
+        self.snapshot.write({'publications': create_publication_df()}, generation=2)
+        self.assertEqual(self.snapshot.read_many({'publications'}, generation=3), {})
+        self.assertIn('publications', self.snapshot.read_many({'publications'}, generation=2))
+
+
+# values_list columns returned by the database for each extracted field
+EXTRACTED_COLUMNS = {
+    'id': [3, 5], 'container_id': [10, 11], 'container__name': ['Ecological Modelling', 'JASSS'],
+    'date_published': [date(2001, 5, 1), None], 'year_published': [2001, None], 'has_available_code': [True, False],
+    'has_flow_charts': [False, False], 'has_math_description': [True, False], 'has_odd': [False, True],
+    'has_pseudocode': [False, False], 'status': ['REVIEWED', 'available'], 'title': ['An agent based model', None],
+    'publication_id': [3, 5], 'author_id': [1, 2], 'author__name': ['Grimm', 'Railsback'], 'platform_id': [1, 1],
+    'platform__name': ['NetLogo', 'NetLogo'], 'sponsor_id': [4, 6], 'sponsor__name': ['NSF', None], 'tag_id': [7, 8],
+    'tag__name': ['ecology', 'land use'], 'category__category': ['Archive', 'Journal'],
+    'category__subcategory': ['CoMSES', 'Journal'],
+}
+
+
+class SnapshotDtypesTest(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_snapshot_frames_match_cached_frames(self):
+        with patch('catalog.core.visualization.data_access.read_columns',
+                   side_effect=lambda queryset, fields: [EXTRACTED_COLUMNS[field] for field in fields]):
+            frames = {key: compact_related_df(key, create_related_df(Publication.objects.none()))
+                      for key, create_related_df in VisualizationCache.CREATE_RELATED_DF.items()}
+        snapshot = ColumnarSnapshot(self.root)
+        snapshot.write(frames)
+        for key, df in snapshot.read_many(set(frames)).items():
+            pd.testing.assert_series_equal(df.dtypes, frames[key].dtypes)
+            pd.testing.assert_frame_equal(df, frames[key])
+
+
+class RefreshTest(SimpleTestCase):
+    @patch('catalog.core.visualization.data_access.get_version_stamp', return_value='4:0001_initial')
+    @patch('catalog.core.visualization.data_access.cache')
+    def test_watermark_is_read_before_the_changes(self, cache, get_version_stamp):
+        cache.get.return_value = {'version': '4:0001_initial', 'watermark': 1}
+        calls = []
+        with patch('catalog.core.visualization.data_access.get_high_water_mark',
+                   side_effect=lambda: calls.append('watermark') or 2), \
+                patch('catalog.core.visualization.data_access.get_changed_publication_ids',
+                      side_effect=lambda since: calls.append('changes') or {3}), \
+                patch.object(VisualizationCache, '_apply_changes') as apply_changes:
+            VisualizationCache().refresh()
+        self.assertEqual(calls, ['watermark', 'changes'])
+        apply_changes.assert_called_once_with({3}, state={'version': '4:0001_initial', 'watermark': 2}, workers=None)
+
+
+@override_settings(CACHES=TEST_CACHES, VISUALIZATION_CACHE_GENERATION_GRACE_PERIOD=0)
+class VisualizationCachePublishTest(SimpleTestCase):
+    def setUp(self):
+        self.visualization_cache = VisualizationCache()
+        self.frames = {'publications': create_publication_df()}
+        self.clear()
+        self.addCleanup(self.clear)
+
+    def clear(self):
+        cache.delete_many([VISUALIZATION_CACHE_GENERATION_KEY, VISUALIZATION_CACHE_GENERATION_COUNTER_KEY])
+        cache.delete_many([VisualizationCache.get_frame_key(generation, 'publications') for generation in range(1, 4)])
+        self.visualization_cache.connection.delete(cache.make_key(VISUALIZATION_CACHE_RETIRED_GENERATIONS_KEY))
+
+    def test_retired_generations_are_deleted(self):
+        self.assertEqual(self.visualization_cache.publish(self.frames), 1)
+        self.assertEqual(self.visualization_cache.publish(self.frames), 2)
+        self.assertEqual(VisualizationCache.get_generation(), 2)
+        self.assertIsNone(cache.get(VisualizationCache.get_frame_key(1, 'publications')))
+        self.assertIsNotNone(cache.get(VisualizationCache.get_frame_key(2, 'publications')))
+        self.assertEqual(self.visualization_cache.connection.zcard(
+            cache.make_key(VISUALIZATION_CACHE_RETIRED_GENERATIONS_KEY)), 0)
+
+    @override_settings(VISUALIZATION_CACHE_GENERATION_GRACE_PERIOD=600)
+    def test_keys_are_stored_under_the_cache_key_prefix(self):
+        self.visualization_cache.publish(self.frames)
+        self.visualization_cache.publish(self.frames)
+        connection = self.visualization_cache.connection
+        self.assertEqual(int(connection.get('test:1:{}'.format(VISUALIZATION_CACHE_GENERATION_KEY))), 2)
+        self.assertEqual(connection.zcard('test:1:{}'.format(VISUALIZATION_CACHE_RETIRED_GENERATIONS_KEY)), 1)
+
+    def test_older_generation_does_not_replace_newer_generation(self):
+        self.visualization_cache.publish(self.frames)
+        # a build that started later published generation 3 while this one was still building generation 2
+        cache.set(VISUALIZATION_CACHE_GENERATION_KEY, 3, None)
+        self.assertEqual(self.visualization_cache.publish(self.frames), 3)
+        self.assertEqual(VisualizationCache.get_generation(), 3)
+        self.assertIsNone(cache.get(VisualizationCache.get_frame_key(2, 'publications')))
+
+    def test_snapshot_is_stamped_with_the_published_generation(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        visualization_cache = VisualizationCache(snapshot_root=root)
+        visualization_cache.publish(self.frames)
+        snapshot = visualization_cache.snapshot
+        self.assertEqual(snapshot.read_generation(snapshot.current_path()), 1)
+        # another build published generation 3, the snapshot of generation 2 is discarded instead of activated
+        cache.set(VISUALIZATION_CACHE_GENERATION_KEY, 3, None)
+        visualization_cache.publish(self.frames)
+        self.assertEqual(snapshot.read_generation(snapshot.current_path()), 1)
+        self.assertEqual(len([name for name in os.listdir(root) if name.startswith('snapshot-')]), 1)
+        with patch.object(visualization_cache, '_get_many', return_value={}), \
+                patch.object(visualization_cache, '_create_missing', return_value={}) as create_missing:
+            visualization_cache.get_or_create_many({'publications'})
+        create_missing.assert_called_once_with({'publications'})
+
+
+class UpsertRelatedDataFrameTest(SimpleTestCase):
+    def test_changed_and_deleted_publications_are_replaced(self):
+        code_archive_urls_df = pd.DataFrame.from_records([
+            {'publication_id': 3, 'code_archive_url_id': 1, 'category': 'Archive'},
+            {'publication_id': 5, 'code_archive_url_id': 2, 'category': 'Code Repository'},
+            {'publication_id': 8, 'code_archive_url_id': 3, 'category': 'Archive'},
+        ], index='publication_id').astype({'category': 'category'})
+        changed_df = pd.DataFrame.from_records([
+            {'publication_id': 5, 'code_archive_url_id': 2, 'category': 'Journal'},
+            {'publication_id': 5, 'code_archive_url_id': 4, 'category': 'Archive'},
+        ], index='publication_id')
+        df = upsert_related_df(code_archive_urls_df, changed_df, {5, 8})
+        self.assertEqual(sorted(df.index), [3, 5, 5])
+        self.assertEqual(sorted(df.loc[5, 'category']), ['Archive', 'Journal'])
+        self.assertTrue(pd.api.types.is_categorical_dtype(df['category'].dtype))
+        self.assertEqual(df.index.name, 'publication_id')
+
+
+class BuildManyTest(SimpleTestCase):
+    def test_parallel_build_matches_sequential_build(self):
+        keys = {'authors', 'platforms', 'publications'}
+        self.assertEqual(build_many(keys, str.upper, workers=3), build_many(keys, str.upper))
+        self.assertEqual(build_many(keys, str.upper, workers=3)['authors'], 'AUTHORS')
+
+
+class CompactRelatedDataFrameTest(SimpleTestCase):
+    def test_compact_dtypes(self):
+        df = compact_related_df('publications', create_publication_df())
+        self.assertEqual(df['container_id'].dtype, 'int32')
+        self.assertTrue(pd.api.types.is_categorical_dtype(df['container_name'].dtype))
+        self.assertEqual(str(df['year_published'].dtype), 'Int16')
+        self.assertEqual(df['has_odd'].dtype, bool)
+        self.assertEqual(df.groupby('year_published')['has_odd'].sum().to_dict(), {2001: 0, 2010: 1})
+
+
+class PublicationPositionIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.position_index = PublicationPositionIndex(create_publication_df().iloc[[2, 0, 1]])
+
+    def test_mask(self):
+        self.assertEqual(list(self.position_index.offsets([3, 4, 8])), [1, -1, 0])
+        self.assertEqual(list(self.position_index.mask([5, 8, 13])), [True, False, True])
+        self.assertTrue(self.position_index.mask().all())
+
+    def test_related_mask(self):
+        author_df = pd.DataFrame.from_records([
+            {'publication_id': 3, 'author_id': 1},
+            {'publication_id': 8, 'author_id': 1},
+            {'publication_id': 8, 'author_id': 2},
+            {'publication_id': 21, 'author_id': 3},
+        ], index='publication_id')
+        mask = self.position_index.related_mask('authors', author_df, self.position_index.mask([8]))
+        self.assertEqual(list(mask), [False, True, True, False])
+
+
+class TimeseriesCubeTest(SimpleTestCase):
+    def setUp(self):
+        def related_df(column, name_column, records):
+            return pd.DataFrame.from_records([{'publication_id': p, column: i, name_column: n} for p, i, n in records],
+                                             columns=['publication_id', column, name_column], index='publication_id')
+
+        code_archive_urls_df = pd.DataFrame.from_records([
+            {'publication_id': 3, 'category': 'Archive'},
+            {'publication_id': 3, 'category': 'Journal'},
+            {'publication_id': 8, 'category': 'Archive'},
+        ], index='publication_id').astype({'category': 'category'})
+        self.frames = {
+            'publications': create_publication_df(),
+            'authors': related_df('author_id', 'name', [(3, 1, 'Grimm'), (5, 1, 'Grimm')]),
+            'code_archive_urls': code_archive_urls_df,
+            'platforms': related_df('platform_id', 'platform_name',
+                                    [(3, 1, 'NetLogo'), (8, 1, 'NetLogo'), (8, 2, 'Repast')]),
+            'sponsors': related_df('sponsor_id', 'sponsor_name', [(5, 1, 'NSF')]),
+            'tags': related_df('tag_id', 'tag_name', []),
+        }
+        self.cube = TimeseriesCube(self.frames)
+
+    def test_year_counts(self):
+        year_counts = self.cube.get_year_counts('', {'container': {10, 11}, 'platforms': set()})
+        self.assertEqual(year_counts['count'].to_dict(), {2001.0: 1, 2010.0: 1})
+        self.assertEqual(year_counts['category:Archive'].to_dict(), {2001.0: 1, 2010.0: 1})
+        self.assertEqual(self.cube.get_year_counts('', {'platforms': {1}})['has_odd'].to_dict(),
+                         {2001.0: 0, 2010.0: 1})
+
+    def test_unsupported_selections(self):
+        self.assertIsNone(self.cube.get_year_counts('model', {}))
+        self.assertIsNone(self.cube.get_year_counts('', {'platforms': {1, 2}}))
+        self.assertIsNone(self.cube.get_year_counts('', {'container': {10}, 'platforms': {1}}))
+        self.assertIsNone(self.cube.get_year_counts('', {'authors': {1}}))
+        self.assertIsNone(self.cube.get_year_counts('', {'sponsors': {1}}))
+
+    def test_sum_by_year(self):
+        mask = self.frames['publications'].index.isin([3, 5, 8])
+        pd.testing.assert_frame_equal(self.cube.sum_by_year(mask),
+                                      self.cube.measures_df[mask].groupby('year_published').sum())
+        self.assertTrue(self.cube.sum_by_year(np.zeros(len(mask), dtype=bool)).empty)
+
+    def test_archival_dfs(self):
+        df, df_percent = self.cube.archival_dfs(self.cube.get_year_counts('', {}))
+        self.assertEqual(df.loc[2001, ('category', 'Journal')], 1)
+        self.assertEqual(df_percent.loc[2010, 'Archive'], 1.0)
+        self.assertEqual(df_percent.loc[1995, 'Archive'], 0.0)
+
+    def test_code_availability_without_matching_years(self):
+        counts = self.cube.sum_by_year(np.zeros(len(self.frames['publications']), dtype=bool))
+        df = self.cube.code_availability_df(counts)
+        self.assertEqual(df.index.max(), 2010)
+        self.assertEqual(df[('year_published', 'count')].sum(), 0)
+
+    def test_aggregate(self):
+        position_index = PublicationPositionIndex(self.frames['publications'])
+        aggregator = VisualizationAggregator(self.frames, position_index, self.cube, create_entity_codes(self.frames),
+                                             position_index.mask([3, 8]))
+        self.assertEqual(aggregator.aggregate('top_platforms')['name'].to_list(), ['NetLogo', 'Repast'])
+        self.assertEqual(aggregator.aggregate('top_platforms')['count'].to_list(), [2, 1])
+        self.assertEqual(aggregator.aggregate('top_journals')['count'].to_list(), [2])
+        self.assertEqual(aggregator.aggregate('top_authors')['count'].to_list(), [1])
+        self.assertTrue(aggregator.aggregate('top_sponsors').empty)
+        self.assertEqual(aggregator.aggregate('code_availability').loc[2001, ('has_available_code', 'mean')], 1.0)
+        self.assertEqual(aggregator.aggregate('documentation_standards').loc[2010, ('has_odd', 'sum')], 1)
+
+
+class EntityCodesTest(SimpleTestCase):
+    def setUp(self):
+        self.author_df = pd.DataFrame.from_records([
+            {'publication_id': 3, 'author_id': 40, 'name': 'Railsback'},
+            {'publication_id': 3, 'author_id': 7, 'name': 'Grimm'},
+            {'publication_id': 5, 'author_id': 40, 'name': 'Railsback'},
+            {'publication_id': 5, 'author_id': 12, 'name': 'Berger'},
+            {'publication_id': 8, 'author_id': 12, 'name': 'Berger'},
+            {'publication_id': 8, 'author_id': 7, 'name': 'Grimm'},
+            {'publication_id': 8, 'author_id': 40, 'name': 'Railsback'},
+        ], index='publication_id').astype({'name': 'category'})
+        self.entity_codes = EntityCodes(self.author_df, 'author_id', 'name')
+
+    def test_top(self):
+        df = self.entity_codes.top(np.ones(len(self.author_df), dtype=bool), n=2)
+        self.assertEqual(list(df.index), [40, 7])
+        self.assertEqual(df['name'].to_list(), ['Railsback', 'Grimm'])
+        self.assertEqual(df['count'].to_list(), [3, 2])
+
+    def test_top_of_selected_rows(self):
+        mask = self.author_df.index.isin([5, 8])
+        df = self.entity_codes.top(mask, n=50)
+        self.assertEqual(list(df.index), [12, 40, 7])
+        self.assertEqual(df['count'].to_list(), [2, 2, 1])
+        self.assertTrue(self.entity_codes.top(np.zeros(len(self.author_df), dtype=bool)).empty)
+
+
+class FigureTemplateTest(SimpleTestCase):
+    def test_render_matches_figure(self):
+        def create_figure(x, y, name):
+            return go.Figure(data=[go.Scatter(x=x, y=y, name=name)], layout=go.Layout(title='Archival Location'))
+
+        template = FigureTemplate(lambda: create_figure([], [], ''))
+        figure_json = template.render([(0, {'name': 'Archive', 'x': np.array([2001, 2002]), 'y': np.array([0.5, 1.0])})])
+        self.assertEqual(json.loads(json.dumps(figure_json, cls=PlotJSONEncoder)),
+                         json.loads(json.dumps(create_figure([2001, 2002], [0.5, 1.0], 'Archive').to_plotly_json())))
+
+
+class InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   VISUALIZATION_PLOT_CACHE_SOFT_TIMEOUT=0, VISUALIZATION_PLOT_CACHE_HARD_TIMEOUT=60,
+                   VISUALIZATION_PLOT_REFRESH_LOCK_TIMEOUT=60, VISUALIZATION_PLOT_CACHE_MAX_BYTES=None)
+class PlotCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.plot_cache = PlotCache()
+        self.plot_cache._executor = InlineExecutor()
+
+    def test_stale_value_is_served_while_refreshed(self):
+        values = iter(['first', 'second', 'third'])
+        self.assertEqual(self.plot_cache.get_or_compute('plot', lambda: next(values), 'top-author'), 'first')
+        self.assertEqual(self.plot_cache.get_or_compute('plot', lambda: next(values), 'top-author'), 'first')
+        self.assertEqual(self.plot_cache.get_or_compute('plot', lambda: next(values), 'top-author'), 'second')
+        # every stale read refreshed the plot once
+        self.assertEqual(cache.get('plot')[0], 'third')
+        self.assertIsNone(next(values, None))
+
+    def test_plain_plot_json_is_a_miss(self):
+        cache.set('plot', '{"data": []}')
+        self.assertEqual(self.plot_cache.get_or_compute('plot', lambda: 'first', 'top-author'), 'first')
+
+    def test_failed_refresh_keeps_stale_value(self):
+        def fail():
+            raise ValueError('elasticsearch unavailable')
+
+        self.plot_cache.get_or_compute('plot', lambda: 'first', 'top-author')
+        with self.assertLogs('catalog.core.visualization.plot_cache', 'ERROR'):
+            self.assertEqual(self.plot_cache.get_or_compute('plot', fail, 'top-author'), 'first')
+        self.assertEqual(self.plot_cache.get_or_compute('plot', lambda: 'second', 'top-author'), 'first')
+        self.assertEqual(self.plot_cache.get_or_compute('plot', lambda: 'third', 'top-author'), 'second')
+
+
+@override_settings(CACHES=TEST_CACHES, VISUALIZATION_PLOT_CACHE_SOFT_TIMEOUT=60,
+                   VISUALIZATION_PLOT_CACHE_HARD_TIMEOUT=60, VISUALIZATION_PLOT_CACHE_MAX_BYTES=10,
+                   VISUALIZATION_PLOT_CACHE_ADMIT_AFTER=2, VISUALIZATION_PLOT_CACHE_ADMISSION_WINDOW=60)
+class BoundedPlotCacheTest(SimpleTestCase):
+    KEYS = ['test-plot-a', 'test-plot-b', 'test-plot-c']
+
+    def setUp(self):
+        self.plot_cache = PlotCache()
+        self.clear()
+        self.addCleanup(self.clear)
+
+    def clear(self):
+        cache.delete_many(self.KEYS)
+        self.plot_cache.connection.delete(*[cache.make_key(key) for key in (
+            VISUALIZATION_PLOT_LRU_KEY, VISUALIZATION_PLOT_ENTRIES_KEY, VISUALIZATION_PLOT_BYTES_KEY,
+            *[VISUALIZATION_PLOT_MISSES_KEY.format(key=key) for key in self.KEYS])])
+
+    def test_plots_are_admitted_after_repeated_misses(self):
+        self.assertEqual(self.plot_cache.get_or_compute('test-plot-a', lambda: 'first', 'top-author'), 'first')
+        self.assertIsNone(cache.get('test-plot-a'))
+        self.assertEqual(self.plot_cache.get_or_compute('test-plot-a', lambda: 'second', 'top-author'), 'second')
+        self.assertEqual(self.plot_cache.get_or_compute('test-plot-a', lambda: 'third', 'top-author'), 'second')
+
+    def test_namespace_bytes(self):
+        self.plot_cache.set('test-plot-a', 'abcd', 'top-author')
+        self.plot_cache.set('test-plot-b', 'abc', 'top-tag')
+        self.plot_cache.set('test-plot-a', 'ab', 'top-author')
+        self.assertEqual(self.plot_cache.get_namespace_bytes(), {'top-author': 2, 'top-tag': 3})
+
+    def test_concurrent_stores_of_a_plot_are_accounted_once(self):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: self.plot_cache.set('test-plot-a', 'abcd', 'top-author'), range(32)))
+        self.assertEqual(self.plot_cache.get_namespace_bytes(), {'top-author': 4})
+
+    def test_least_recently_used_plots_are_evicted(self):
+        self.plot_cache.set('test-plot-a', 'abcd', 'top-author')
+        self.plot_cache.set('test-plot-b', 'abcd', 'top-tag')
+        self.assertEqual(self.plot_cache.get_or_compute('test-plot-a', lambda: 'unused', 'top-author'), 'abcd')
+        self.plot_cache.set('test-plot-c', 'abcd', 'top-tag')
+        self.assertIsNone(cache.get('test-plot-b'))
+        self.assertIsNotNone(cache.get('test-plot-a'))
+        self.assertIsNotNone(cache.get('test-plot-c'))
+        self.assertEqual(self.plot_cache.get_namespace_bytes(), {'top-author': 4, 'top-tag': 4})
+
+    def test_bookkeeping_is_stored_under_the_cache_key_prefix(self):
+        self.plot_cache.set('test-plot-a', 'abcd', 'top-author')
+        connection = self.plot_cache.connection
+        self.assertEqual(connection.zcard('test:1:{}'.format(VISUALIZATION_PLOT_LRU_KEY)), 1)
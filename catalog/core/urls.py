@@ -31,6 +31,8 @@ curator_urls = [
 urlpatterns = [
     path('curator/', include(curator_urls)),
     path('visualization/', views.public_visualization_view, name='public-visualization'),
+    path('visualization/plots/<slug:name>/', views.public_visualization_plot_view,
+         name='public-visualization-plot'),
     path('publications/', views.public_search_view, name='public-search'),
     path('publications/add/', views.suggest_a_publication, name='suggest-a-publication'),
     path('publications/<int:pk>/', views.PublicationDetailView.as_view(), name='public-publication-detail'),
@@ -16,20 +16,23 @@ from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.mail import send_mail
 from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.db.models import Count, Q, F, Value as V, Max
 from django.db.models.functions import Concat
-from django.http import JsonResponse, HttpResponseRedirect, StreamingHttpResponse, QueryDict
+from django.http import JsonResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse, QueryDict, Http404
 from django.shortcuts import resolve_url, render, redirect
 from django.template.loader import get_template
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
 from django.utils.http import is_safe_url
 from django.utils.translation import ugettext_lazy as _
 from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.debug import sensitive_post_parameters
+from django.views.decorators.http import condition
 from django.views.generic import TemplateView, FormView, DetailView
 from haystack.generic_views import SearchView
 from haystack.query import SearchQuerySet
@@ -48,12 +51,16 @@ from citation.serializers import (CatalogPagination, PublicationListSerializer,
                                   PublicationAggregationSerializer, AuthorAggregrationSerializer,
                                   SuggestMergeSerializer)
 from citation.util import render_sanitized_markdown, send_markdown_email
+from . import metrics
 from .forms import CatalogAuthenticationForm, CatalogSearchForm
 from .forms import PublicSearchForm, SuggestedPublicationForm, SubmitterForm, ContactAuthorsForm
 from .search_indexes import (PublicationDoc, PublicationDocSearch, normalize_search_querydict,
-                             get_search_index)
+                             get_search_fingerprint, get_search_index, get_search_index_generation)
 from .visualization import plots, data_access
-from .visualization.data_access import visualization_cache
+from .visualization.aggregation import TIMESERIES_AGGREGATES, VisualizationAggregator
+from .visualization.figures import PlotJSONEncoder
+from .visualization.plot_cache import plot_cache
+from .visualization.data_access import visualization_cache, VisualizationCacheUnavailable
 
 logger = logging.getLogger(__name__)
 
@@ -757,6 +764,76 @@ def with_vary_header(view):
     return f
 
 
+def with_visualization_cache_unavailable_response(view):
+    """Responds with 503 Service Unavailable while another worker rebuilds the visualization dataframes"""
+    def f(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except VisualizationCacheUnavailable as e:
+            logger.warning('visualization cache unavailable while rebuilding %s', e)
+            response = HttpResponse('Visualization data is being rebuilt. Please try again shortly.',
+                                    content_type='text/plain', status=503)
+            response['Retry-After'] = settings.VISUALIZATION_CACHE_REBUILD_WAIT
+            return response
+    return f
+
+
+def get_canonical_query(query_dict: QueryDict):
+    """Search fingerprint and sorted remaining parameters of a query, equal for queries rendering the same page"""
+    search, filters = normalize_search_querydict(query_dict)
+    other = sorted((key, sorted(values)) for key, values in query_dict.lists() if key != 'search' and key not in filters)
+    return [get_search_fingerprint(search, filters), other]
+
+
+def with_conditional_get(get_generations):
+    """Validates responses with an ETag and answers repeat requests with 304 Not Modified
+
+    The ETag covers the path, the user, the canonical query and the generations returned by
+    get_generations(request, *args, **kwargs) for the data the response is rendered from. Successful responses may be
+    reused for PUBLIC_PAGE_MAX_AGE seconds and served stale for PUBLIC_PAGE_STALE_WHILE_REVALIDATE more seconds while
+    they are revalidated.
+    """
+    def decorator(view):
+        def f(request, *args, **kwargs):
+            if messages.get_messages(request):
+                # flash messages are only shown once so pages displaying them are neither validated nor reused
+                return view(request, *args, **kwargs)
+            validators = [request.path, request.user.pk, get_canonical_query(request.GET),
+                          get_generations(request, *args, **kwargs)]
+            etag = '"{}"'.format(sha1(json.dumps(validators, cls=DjangoJSONEncoder).encode('utf-8')).hexdigest())
+            response = condition(etag_func=lambda request, *args, **kwargs: etag)(view)(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                del response['ETag']
+                return response
+            cache_control = {'private': True} if request.user.is_authenticated else {'public': True}
+            patch_cache_control(response, max_age=settings.PUBLIC_PAGE_MAX_AGE,
+                                stale_while_revalidate=settings.PUBLIC_PAGE_STALE_WHILE_REVALIDATE, **cache_control)
+            return response
+        return f
+    return decorator
+
+
+def get_search_generations(request, *args, **kwargs):
+    return [get_search_index_generation()]
+
+
+def get_visualization_generations(request, *args, **kwargs):
+    return [get_search_index_generation(), visualization_cache.get_generation()]
+
+
+def get_publication_generations(request, pk):
+    """Validators of a publication detail page
+
+    Changes to rows a publication displays that leave no date_modified, like deleted through rows and renamed shared
+    rows, are included from the publication change log. The search index generation also retires pages after index
+    rebuilds and syncs
+    """
+    last_modified = data_access.get_publication_last_modified(pk)
+    # isoformat keeps the microseconds the JSON encoder would round to milliseconds
+    return [last_modified and last_modified.isoformat(), get_search_index_generation()]
+
+
+@with_conditional_get(get_search_generations)
 def public_search_view(request):
     search, filters = normalize_search_querydict(request.GET)
     query_dict = request.GET.copy()
@@ -784,12 +861,12 @@ def public_search_view(request):
     return render(request, 'public/search.html', context)
 
 
+@with_conditional_get(get_visualization_generations)
 def public_visualization_view(request):
     content_type = request.GET.get('content_type', 'sponsors')
     search, filters = normalize_search_querydict(request.GET)
     publication_query = PublicationDocSearch().find(q=search, facet_filters=filters)[:0].agg_by_count()
-    publication_pks = data_access.get_publication_pks_matching_search_criteria(query=search, facet_filters=filters)
-    publication_query.execute(facet_filters=filters)
+    response = publication_query.execute(facet_filters=filters)
     facets = publication_query.cache
     arguments = request.GET.copy()
     arguments.pop('page', None)
@@ -809,89 +886,62 @@ def public_visualization_view(request):
         {'value': 'tags', 'label': 'Tags'}
     ]
 
-    cache_key = '/visualization/{}'.format(request.GET.urlencode())
-    plot_items = cache.get(cache_key)
-    if not plot_items:
-        cached_dfs = visualization_cache.get_or_create_many()
-        publication_df = cached_dfs['publications']
-        code_archive_urls_df = cached_dfs['code_archive_urls']
-        author_df = cached_dfs['authors']
-        platform_df = cached_dfs['platforms']
-        sponsor_df = cached_dfs['sponsors']
-
-        archival_timeseries_plots = plots.archival_timeseries_plot(publication_df, code_archive_urls_df,
-                                                                   publication_pks)
-        code_availability_timeseries_plots = plots.code_availability_timeseries_plot(publication_df, publication_pks)
-        documentation_timeseries_plots = plots.documentation_standards_timeseries_plot(publication_df, publication_pks)
-
-        plot_items = {
-            'top_author_plot': {
-                'data': plots.top_author_plot(author_df, publication_pks).to_plotly_json(),
-                'data_id': 'top-author-plot-data',
-                'id': 'top-author-plot'
-            },
-            'top_journal_plot': {
-                'data': plots.top_journal_plot(publication_df, publication_pks).to_plotly_json(),
-                'data_id': 'top-journal-plot-data',
-                'id': 'top-journal-plot'
-            },
-            'top_platform_plot': {
-                'data': plots.top_platform_plot(platform_df, publication_pks).to_plotly_json(),
-                'data_id': 'top-platform-plot-data',
-                'id': 'top-platform-plot'
-            },
-            'top_sponsor_plot': {
-                'data': plots.top_sponsor_plot(sponsor_df, publication_pks).to_plotly_json(),
-                'data_id': 'top-sponsor-plot-data',
-                'id': 'top-sponsor-plot'
-            },
-            'archival_timeseries_count_plot': {
-                'data': archival_timeseries_plots['count'].to_plotly_json(),
-                'data_id': 'archival-timeseries-count-plot-data',
-                'id': 'archival-timeseries-count-plot'
-            },
-            'archival_timeseries_percent_plot': {
-                'data': archival_timeseries_plots['percent'].to_plotly_json(),
-                'data_id': 'archival-timeseries-percent-plot-data',
-                'id': 'archival-timeseries-percent-plot'
-            },
-            'code_availability_timeseries_count_plot': {
-                'data': code_availability_timeseries_plots['count'].to_plotly_json(),
-                'data_id': 'code-availability-timeseries-count-plot-data',
-                'id': 'code-availability-timeseries-count-plot'
-            },
-            'code_availability_timeseries_percent_plot': {
-                'data': code_availability_timeseries_plots['percent'].to_plotly_json(),
-                'data_id': 'code-availability-timeseries-percent-plot-data',
-                'id': 'code-availability-timeseries-percent-plot'
-            },
-            'documentation_timeseries_count_plot': {
-                'data': documentation_timeseries_plots['count'].to_plotly_json(),
-                'data_id': 'documentation-timeseries-count-plot-data',
-                'id': 'documentation-timeseries-count-plot'
-            },
-            'documentation_timeseries_percent_plot': {
-                'data': documentation_timeseries_plots['percent'].to_plotly_json(),
-                'data_id': 'documentation-timeseries-percent-plot-data',
-                'id': 'documentation-timeseries-percent-plot'
-            }
-        }
-        cache.set(cache_key, plot_items, 300)
+    # the plots are loaded in parallel from the plot endpoint so the page doesn't wait on them
+    plot_urls = ['{}?{}'.format(reverse('core:public-visualization-plot', args=[name]), arguments.urlencode())
+                 for name in plots.PLOT_FAMILIES]
 
     return render(request, 'public/visualization.html',
                   context={
-                      'plots': plot_items,
+                      'plot_urls': plot_urls,
                       'breadcrumb_trail': breadcrumb_trail,
                       'content_type_options': content_type_options,
-                      'n_matches': len(publication_pks),
+                      'n_matches': response.hits.total,
                       'search': search, 'content_type': content_type,
                       'facets': facets})
 
 
+@with_conditional_get(get_visualization_generations)
+@with_visualization_cache_unavailable_response
+def public_visualization_plot_view(request, name):
+    """JSON for one family of visualization plots, keyed by the id of the element each plot is drawn in"""
+    if name not in plots.PLOT_FAMILIES:
+        raise Http404('Unknown plot {}'.format(name))
+    search, filters = normalize_search_querydict(request.GET)
+    fingerprint = get_search_fingerprint(search, filters)
+
+    def compute_plot_json():
+        aggregate_name, _ = plots.PLOT_FAMILIES[name]
+        cached_dfs = visualization_cache.get_or_create_many()
+        position_index = visualization_cache.get_position_index(cached_dfs['publications'])
+        timeseries_cube = visualization_cache.get_timeseries_cube(cached_dfs)
+        year_counts = None
+        if aggregate_name in TIMESERIES_AGGREGATES:
+            year_counts = timeseries_cube.get_year_counts(search, filters)
+            metrics.record_hit('visualization.timeseries_cube', year_counts is not None)
+        publication_mask = None
+        if year_counts is None:
+            publication_pks = data_access.get_publication_pks_matching_search_criteria(
+                query=search, facet_filters=filters, fingerprint=fingerprint)
+            publication_mask = position_index.mask(publication_pks)
+        aggregator = VisualizationAggregator(cached_dfs, position_index, timeseries_cube,
+                                             visualization_cache.get_entity_codes(cached_dfs), publication_mask,
+                                             year_counts)
+        return json.dumps(plots.render_plot_family(name, aggregator.aggregate(aggregate_name)), cls=PlotJSONEncoder)
+
+    # plot entries are keyed by the dataframe generation so publishing changed publications retires all of them, rather
+    # than tracking which matched sets each batch of changes touched. The ETag includes the same generation, so a
+    # plot is never served under a validator newer than the frames it was computed from
+    cache_key = '/visualization/{}/{}/{}'.format(visualization_cache.get_generation(), fingerprint, name)
+    plot_json = plot_cache.get_or_compute(cache_key, compute_plot_json, namespace=name)
+    return HttpResponse(plot_json, content_type='application/json')
+
+
 @with_vary_header
+@with_conditional_get(lambda request: [visualization_cache.get_generation(), request.content_type])
+@with_visualization_cache_unavailable_response
 def public_home(request):
     if request.content_type == 'application/json':
-        publication_df = visualization_cache.get_publications()
+        publication_df = visualization_cache.get_publications(columns=['year_published', 'has_available_code'])
         return JsonResponse(plots.home_page_plot(publication_df).to_plotly_json())
 
     plot = {
@@ -948,6 +998,10 @@ class PublicationDetailView(DetailView):
     model = Publication
     template_name = 'public/publication_detail.html'
 
+    @method_decorator(with_conditional_get(get_publication_generations))
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
     def get_queryset(self):
         return Publication.api.primary().filter(status='REVIEWED')
 
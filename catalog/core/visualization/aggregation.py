@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+# frame, id column and name column of the entities ranked by each top count
+TOP_COUNT_COLUMNS = {
+    'top_authors': ('authors', 'author_id', 'name'),
+    'top_journals': ('publications', 'container_id', 'container_name'),
+    'top_platforms': ('platforms', 'platform_id', 'platform_name'),
+    'top_sponsors': ('sponsors', 'sponsor_id', 'sponsor_name'),
+}
+
+
+class EntityCodes:
+    """Dense integer codes for the entity ids of a frame, with the id and first name of every code
+
+    Built once per cache generation so counting the entities of a set of rows is a bincount over their codes.
+    """
+
+    def __init__(self, df: pd.DataFrame, id_column, name_column):
+        self.df = df
+        self.id_column = id_column
+        codes, ids = pd.factorize(df[id_column], sort=True)
+        self.codes = codes
+        self.ids = np.asarray(ids)
+        first_rows = pd.Series(codes).drop_duplicates().index.values
+        self.names = np.empty(len(ids), dtype=object)
+        self.names[codes[first_rows]] = np.asarray(df[name_column].iloc[first_rows], dtype=object)
+
+    def top(self, mask, n=10):
+        """The n entities with the most rows selected by mask with their name and number of rows, ties broken by id"""
+        counts = np.bincount(self.codes[mask], minlength=len(self.ids))
+        if 0 < n < np.count_nonzero(counts):
+            # partition for the count of the nth entity and keep every entity tied with it so ties are broken by id
+            threshold = counts[np.argpartition(-counts, n - 1)[n - 1]]
+            top = np.flatnonzero(counts >= threshold)
+        else:
+            top = np.flatnonzero(counts)
+        # codes are assigned in id order
+        top = top[np.lexsort((top, -counts[top]))][:n]
+        return pd.DataFrame({'name': self.names[top], 'count': counts[top]},
+                            index=pd.Index(self.ids[top], name=self.id_column))
+
+
+def create_entity_codes(frames):
+    return {name: EntityCodes(frames[key], id_column, name_column)
+            for name, (key, id_column, name_column) in TOP_COUNT_COLUMNS.items()}
+
+
+# timeseries cube method producing each timeseries aggregate from per year counts
+TIMESERIES_AGGREGATES = {
+    'archival': 'archival_dfs',
+    'code_availability': 'code_availability_df',
+    'documentation_standards': 'documentation_standards_df',
+}
+
+
+class VisualizationAggregator:
+    """Aggregates rendered by the visualization plots for one set of matching publications
+
+    Each aggregate is computed on its own when it is requested. The per year counts shared by the timeseries families
+    come from masked bincounts of the per publication measures of the timeseries cube, computed at most once, and
+    each top count is a bincount of the entity codes of the matching rows of its frame, selected through the position
+    index.
+    """
+
+    def __init__(self, frames, position_index, timeseries_cube, entity_codes, publication_mask, year_counts=None):
+        """
+        :param entity_codes: EntityCodes of each top count, from create_entity_codes
+        :param publication_mask: mask over the publications frame of the matching publications. Only used by the
+        timeseries aggregates when year_counts is None
+        :param year_counts: per year counts already answered by the timeseries cube
+        """
+        self.frames = frames
+        self.position_index = position_index
+        self.timeseries_cube = timeseries_cube
+        self.entity_codes = entity_codes
+        self.publication_mask = publication_mask
+        self._year_counts = year_counts
+
+    @property
+    def year_counts(self):
+        if self._year_counts is None:
+            self._year_counts = self.timeseries_cube.sum_by_year(self.publication_mask)
+        return self._year_counts
+
+    def top_counts(self, name, n=10):
+        key = TOP_COUNT_COLUMNS[name][0]
+        df = self.frames[key]
+        mask = self.publication_mask if key == 'publications' else \
+            self.position_index.related_mask(key, df, self.publication_mask)
+        return self.entity_codes[name].top(mask, n)
+
+    def aggregate(self, name):
+        if name in TOP_COUNT_COLUMNS:
+            return self.top_counts(name)
+        return getattr(self.timeseries_cube, TIMESERIES_AGGREGATES[name])(self.year_counts)
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+TIMESERIES_FLAG_COLUMNS = ['has_available_code', 'has_flow_charts', 'has_math_description', 'has_odd',
+                           'has_pseudocode']
+CATEGORY_COLUMN_PREFIX = 'category:'
+
+
+def get_publication_measures(publication_df: pd.DataFrame, code_archive_urls_df: pd.DataFrame):
+    """One row per publication with its publication year and the values summed by the timeseries plots
+
+    Archive category columns hold the number of archive urls of each category, matching the rows counted by the
+    archival timeseries after joining the publications to their archive urls
+    """
+    measures_df = pd.DataFrame({'year_published': publication_df['year_published'].astype('float64'),
+                                'count': 1}, index=publication_df.index)
+    for column in TIMESERIES_FLAG_COLUMNS:
+        measures_df[column] = publication_df[column].astype('int64')
+    category_counts_df = pd.get_dummies(code_archive_urls_df['category'], prefix='category', prefix_sep=':',
+                                        dtype='int64') \
+        .groupby(level=0).sum()
+    category_counts_df = category_counts_df.reindex(measures_df.index, fill_value=0)
+    return pd.concat([measures_df, category_counts_df], axis=1)
+
+
+class TimeseriesCube:
+    """Per year counts of code availability, documentation flags and archive categories broken down by container,
+    platform, sponsor and tag
+
+    Built once per cache generation. The timeseries plots for a facet selection without a search query are answered
+    by summing the slices of the selected facet ids instead of grouping the matching publication rows. The search
+    combines facets with OR, so slices can only be summed when no publication falls in more than one selected slice:
+    any set of containers or a single platform, sponsor or tag. Other selections return None and are aggregated from
+    the matching rows.
+    """
+    FRAME_KEYS = ('publications', 'code_archive_urls', 'platforms', 'sponsors', 'tags')
+    DIMENSIONS = {
+        'container': ('publications', 'container_id'),
+        'platforms': ('platforms', 'platform_id'),
+        'sponsors': ('sponsors', 'sponsor_id'),
+        'tags': ('tags', 'tag_id'),
+    }
+    SINGLE_VALUED_DIMENSIONS = {'container'}
+    COUNT_COLUMN = 0
+
+    def __init__(self, frames):
+        self.frames = {key: frames[key] for key in self.FRAME_KEYS}
+        publication_df = frames['publications']
+        self.max_year_published = publication_df['year_published'].max()
+        # rows are in the order of the publications frame so publication masks select from it directly
+        self.measures_df = measures_df = get_publication_measures(publication_df, frames['code_archive_urls'])
+        self.categories = [c[len(CATEGORY_COLUMN_PREFIX):] for c in measures_df.columns
+                           if c.startswith(CATEGORY_COLUMN_PREFIX)]
+        # dense year codes (-1 for publications without a year) and a publication x measure matrix in the same row
+        # order so the counts of any publication mask are bincounts of the masked codes
+        self.year_codes, self.years = pd.factorize(measures_df['year_published'], sort=True)
+        self.measure_columns = measures_df.columns.drop('year_published')
+        self.measures = measures_df[self.measure_columns].to_numpy(dtype='int64')
+        self.total = measures_df.groupby('year_published').sum()
+        self.slices = {}
+        for dimension, (key, column) in self.DIMENSIONS.items():
+            dimension_df = measures_df.join(frames[key][[column]], how='inner')
+            self.slices[dimension] = dimension_df.groupby([column, 'year_published']).sum()
+
+    def is_built_from(self, frames):
+        return all(frames.get(key) is df for key, df in self.frames.items())
+
+    def get_year_counts(self, search, facet_filters):
+        """Per year counts for the publications matching facet_filters, None if they can't be summed from slices"""
+        if search:
+            return None
+        selected = {name: ids for name, ids in facet_filters.items() if ids}
+        if not selected:
+            return self.total
+        if len(selected) > 1:
+            return None
+        (dimension, ids), = selected.items()
+        if dimension not in self.slices or (len(ids) > 1 and dimension not in self.SINGLE_VALUED_DIMENSIONS):
+            return None
+        slice_df = self.slices[dimension]
+        matching_df = slice_df[slice_df.index.get_level_values(0).isin(list(ids))]
+        if matching_df.empty:
+            return None
+        return matching_df.groupby(level='year_published').sum()
+
+    def sum_by_year(self, publication_mask):
+        """Per year counts of the publications selected by publication_mask, as measures_df[mask] grouped by year"""
+        year_codes = self.year_codes[publication_mask]
+        measures = self.measures[publication_mask]
+        has_year = year_codes >= 0
+        year_codes, measures = year_codes[has_year], measures[has_year]
+        sums = np.column_stack([np.bincount(year_codes, weights=measures[:, i], minlength=len(self.years))
+                                for i in range(measures.shape[1])]).astype('int64')
+        # groupby only has the years of selected publications
+        present = sums[:, self.COUNT_COLUMN] > 0
+        return pd.DataFrame(sums[present], columns=self.measure_columns,
+                            index=pd.Index(self.years[present], name='year_published'))
+
+    def _year_index(self, max_year_published):
+        return pd.RangeIndex(1990.0, max_year_published + 1.0)
+
+    def code_availability_df(self, counts):
+        # the years run up to the latest year of the selected publications, or of all publications if none have a year
+        max_year_published = self.max_year_published if counts.empty else counts.index.max()
+        return pd.DataFrame({
+            ('year_published', 'count'): counts['count'],
+            ('has_available_code', 'sum'): counts['has_available_code'],
+            ('has_available_code', 'mean'): counts['has_available_code'] / counts['count'],
+        }).reindex(self._year_index(max_year_published), fill_value=0.0)
+
+    def documentation_standards_df(self, counts):
+        columns = {('count', 'count'): counts['count']}
+        for column in TIMESERIES_FLAG_COLUMNS[1:]:
+            columns[(column, 'mean')] = counts[column] / counts['count']
+            columns[(column, 'sum')] = counts[column]
+        return pd.DataFrame(columns).reindex(self._year_index(self.max_year_published), fill_value=0.0)
+
+    def archival_dfs(self, year_counts):
+        counts = year_counts.reindex(self._year_index(self.max_year_published)).fillna(0.0)
+        columns = {('category', category): counts[CATEGORY_COLUMN_PREFIX + category] for category in self.categories}
+        columns[('publications', 'count')] = counts['count']
+        df = pd.DataFrame(columns)
+        df_percent = df['category'].div(df[('publications', 'count')], axis=0).fillna(0.0)
+        return df, df_percent
@@ -1,134 +1,541 @@
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 
 import pandas as pd
+from django.conf import settings
 from django.core.cache import cache
-from django_pandas.io import read_frame
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import BooleanField, Exists, ExpressionWrapper, Max, OuterRef, Q
+from django.db.models.functions import ExtractYear
+from django_redis import get_redis_connection
+from redis.exceptions import LockError
 
-from catalog.core.search_indexes import PublicationDocSearch
+from catalog.core import metrics
+from catalog.core.search_indexes import get_matched_publication_ids
+from catalog.core.signals import publication_change_log
+from .aggregation import TOP_COUNT_COLUMNS, create_entity_codes
+from .cube import TimeseriesCube
+from .position_index import PublicationPositionIndex
+from .snapshot import ColumnarSnapshot
 from citation.models import Publication, Author, PublicationAuthors, Platform, PublicationPlatforms, Sponsor, \
     PublicationSponsors, Tag, PublicationTags, Container, CodeArchiveUrl
 
 logger = logging.getLogger('data_access')
 
+# bump when the columns or semantics of a related dataframe change to force a full rebuild on the next refresh
+VISUALIZATION_CACHE_VERSION = 4
+VISUALIZATION_CACHE_STATE_KEY = 'visualization:state'
+# points at the generation holding the current set of frames, flipped once a new generation is completely written
+VISUALIZATION_CACHE_GENERATION_KEY = 'visualization:generation'
+VISUALIZATION_CACHE_GENERATION_COUNTER_KEY = 'visualization:generation-counter'
+# retired generations scored by the time they were retired, stored under the django cache key prefix
+VISUALIZATION_CACHE_RETIRED_GENERATIONS_KEY = 'visualization:retired-generations'
+VISUALIZATION_CACHE_FRAME_KEY = 'visualization:{generation}:{key}'
+VISUALIZATION_CACHE_REBUILD_LOCK_KEY = 'visualization:rebuild-lock'
+# points the generation key at ARGV[1] unless it already points at a newer generation. Returns whether the pointer
+# moved and the generation it pointed at before, 0 if none
+FLIP_GENERATION_SCRIPT = '''
+local current = tonumber(redis.call('get', KEYS[1]))
+if current and current >= tonumber(ARGV[1]) then
+    return {0, current}
+end
+redis.call('set', KEYS[1], ARGV[1])
+return {1, current or 0}
+'''
+
+PUBLICATION_COLUMNS = ['id', 'container_id', 'container_name', 'date_published', 'year_published',
+                       'has_available_code', 'has_flow_charts', 'has_math_description', 'has_odd', 'has_pseudocode',
+                       'status', 'title']
+CODE_ARCHIVE_URL_COLUMNS = ['publication_id', 'code_archive_url_id', 'category', 'subcategory', 'available']
+PUBLICATION_AUTHOR_COLUMNS = ['publication_id', 'author_id', 'name']
+MODEL_DOCUMENTATION_COLUMNS = {
+    'has_flow_charts': 'Flow charts',
+    'has_math_description': 'Mathematical description',
+    'has_odd': 'ODD',
+    'has_pseudocode': 'Pseudocode',
+}
+# compact column types applied to each related dataframe before it is cached. Ids fit in int32, repeated names are
+# dictionary encoded as categoricals and years use a nullable small int instead of float NaN
+COMPACT_DTYPES = {
+    'authors': {'author_id': 'int32', 'name': 'category'},
+    'code_archive_urls': {'code_archive_url_id': 'int32', 'category': 'category', 'subcategory': 'category',
+                          'available': 'bool'},
+    'platforms': {'platform_id': 'int32', 'platform_name': 'category'},
+    'publications': {'container_id': 'int32', 'container_name': 'category', 'year_published': 'Int16',
+                     'has_available_code': 'bool', 'has_flow_charts': 'bool', 'has_math_description': 'bool',
+                     'has_odd': 'bool', 'has_pseudocode': 'bool', 'status': 'category'},
+    'sponsors': {'sponsor_id': 'int32', 'sponsor_name': 'category'},
+    'tags': {'tag_id': 'int32', 'tag_name': 'category'},
+}
+# rows fetched per round trip of the server side cursors used to extract the related dataframes
+EXTRACTION_CHUNK_SIZE = 5000
+
+# through tables whose changes are tracked by date_modified in addition to Publication.date_modified. Deleted rows and
+# changes to the other related tables are recorded in the publication change log by the signal handlers in
+# catalog.core.signals
+RELATED_CHANGE_MODELS = (PublicationAuthors, PublicationPlatforms, PublicationSponsors)
+
 
 def create_publication_queryset():
-    return Publication.api.primary().reviewed() \
-        .select_related('container') \
-        .prefetch_related('model_documentation') \
-        .with_code_availability_counts()
+    return Publication.api.primary().reviewed()
+
+
+def read_columns(queryset, fields, chunk_size=EXTRACTION_CHUNK_SIZE):
+    """Stream values_list tuples through a server side cursor into one list per field without instantiating models"""
+    columns = [[] for _ in fields]
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        for column, values in zip(columns, zip(*chunk)):
+            column.extend(values)
+    return columns
+
+
+def create_df(queryset, fields, columns, index):
+    df = pd.DataFrame(dict(zip(columns, read_columns(queryset, fields))), columns=columns)
+    return df.set_index(index)
 
 
 def create_publication_df(publication_queryset):
-    def _publication_as_dict(p: Publication):
-        model_documentation = set(d.name for d in p.model_documentation.all())
-        return {'id': p.id,
-                'container_id': p.container.id,
-                'container_name': p.container.name,
-                'date_published': p.date_published,
-                'year_published':
-                    p.date_published.year if p.date_published is not None else None,
-                'has_available_code': p.has_available_code,
-                'has_flow_charts': 'Flow charts' in model_documentation,
-                'has_math_description': 'Mathematical description' in model_documentation,
-                'has_odd': 'ODD' in model_documentation,
-                'has_pseudocode': 'Pseudocode' in model_documentation,
-                'status': p.status,
-                'title': p.title}
-
-    return pd.DataFrame.from_records((_publication_as_dict(p) for p in publication_queryset), index='id')
+    def _has_model_documentation(name):
+        return Exists(Publication.objects.filter(pk=OuterRef('pk'), model_documentation__name=name))
+
+    code_archive_urls = CodeArchiveUrl.objects.filter(publication=OuterRef('pk'))
+    # a publication has available code if it has at least one archive url and all of its archive urls are available
+    has_available_code = ExpressionWrapper(
+        Q(Exists(code_archive_urls.filter(status='available'))) &
+        ~Q(Exists(code_archive_urls.exclude(status='available'))),
+        output_field=BooleanField())
+    queryset = publication_queryset.annotate(
+        has_available_code=has_available_code,
+        year_published=ExtractYear('date_published'),
+        **{column: _has_model_documentation(name) for column, name in MODEL_DOCUMENTATION_COLUMNS.items()})
+    df = create_df(queryset,
+                   fields=['id', 'container_id', 'container__name', 'date_published', 'year_published',
+                           'has_available_code', *MODEL_DOCUMENTATION_COLUMNS, 'status', 'title'],
+                   columns=PUBLICATION_COLUMNS, index='id')
+    df['year_published'] = df['year_published'].astype('float64')
+    return df
 
 
 def create_archive_url_df(publication_queryset):
-    def _code_archive_url_as_dict(c: CodeArchiveUrl):
-        return {
-            'publication_id': c.publication_id,
-            'code_archive_url_id': c.id,
-            'category': str(c.category.category),
-            'subcategory': str(c.category.subcategory),
-            'available': c.status == 'available'
-        }
-
-    df = pd.DataFrame.from_records(
-        (_code_archive_url_as_dict(c) for c in
-         CodeArchiveUrl.objects.filter(publication__in=publication_queryset).select_related('category')),
-        index='publication_id')
-    df['category'] = df['category'].astype('category')
-    df['subcategory'] = df['subcategory'].astype('category')
+    df = create_df(CodeArchiveUrl.objects.filter(publication__in=publication_queryset),
+                   fields=['publication_id', 'id', 'category__category', 'category__subcategory', 'status'],
+                   columns=CODE_ARCHIVE_URL_COLUMNS, index='publication_id')
+    df['available'] = df['available'] == 'available'
+    df['category'] = df['category'].astype(str).astype('category')
+    df['subcategory'] = df['subcategory'].astype(str).astype('category')
     return df
 
 
 def create_publication_author_df(publication_queryset):
-    def _publication_author_as_dict(pa: PublicationAuthors):
-        return {
-            'publication_id': pa.publication_id,
-            'author_id': pa.author_id,
-            'name': pa.author.name
-        }
-
-    return pd.DataFrame.from_records(
-        (_publication_author_as_dict(pa) for pa in
-         PublicationAuthors.objects.filter(publication__in=publication_queryset).select_related('author')),
-        index='publication_id')
+    return create_df(PublicationAuthors.objects.filter(publication__in=publication_queryset),
+                     fields=['publication_id', 'author_id', 'author__name'],
+                     columns=PUBLICATION_AUTHOR_COLUMNS, index='publication_id')
 
 
 def create_publication_platform_df(publication_queryset):
-    publication_platforms = read_frame(
-        PublicationPlatforms.objects.filter(publication__in=publication_queryset),
-        fieldnames=['publication__id', 'platform__id', 'platform__name'], index_col='publication__id') \
-        .rename(columns={'platform__id': 'platform_id', 'platform__name': 'platform_name'})
-    return publication_platforms
+    return create_df(PublicationPlatforms.objects.filter(publication__in=publication_queryset),
+                     fields=['publication_id', 'platform_id', 'platform__name'],
+                     columns=['publication_id', 'platform_id', 'platform_name'], index='publication_id')
 
 
 def create_publication_sponsor_df(publication_queryset):
-    publication_sponsors = read_frame(
-        PublicationSponsors.objects.filter(publication__in=publication_queryset),
-        fieldnames=['publication__id', 'sponsor__id', 'sponsor__name'], index_col='publication__id') \
-        .rename(columns={'sponsor__id': 'sponsor_id', 'sponsor__name': 'sponsor_name'})
-    return publication_sponsors
+    return create_df(PublicationSponsors.objects.filter(publication__in=publication_queryset),
+                     fields=['publication_id', 'sponsor_id', 'sponsor__name'],
+                     columns=['publication_id', 'sponsor_id', 'sponsor_name'], index='publication_id')
+
+
+def create_publication_tag_df(publication_queryset):
+    return create_df(PublicationTags.objects.filter(publication__in=publication_queryset),
+                     fields=['publication_id', 'tag_id', 'tag__name'],
+                     columns=['publication_id', 'tag_id', 'tag_name'], index='publication_id')
+
+
+class VisualizationCacheUnavailable(Exception):
+    """Raised when the related dataframes are being rebuilt by another worker and no previous copy is available"""
+
+
+def get_version_stamp():
+    """Identifies the cache format and database schema the related dataframes were built against"""
+    latest_migration = MigrationRecorder.Migration.objects.filter(app='citation') \
+        .order_by('-applied').values_list('name', flat=True).first()
+    return '{}:{}'.format(VISUALIZATION_CACHE_VERSION, latest_migration)
+
+
+def get_high_water_mark():
+    """Latest modification time over publications, their tracked related tables and the publication change log"""
+    timestamps = [model.objects.aggregate(latest=Max('date_modified'))['latest']
+                  for model in (Publication,) + RELATED_CHANGE_MODELS]
+    timestamps.append(publication_change_log.latest())
+    return max((t for t in timestamps if t is not None), default=None)
+
+
+def get_publication_last_modified(publication_id):
+    """Latest modification time of a publication, its tracked related rows and its publication change log entry"""
+    querysets = [Publication.objects.filter(pk=publication_id)] + \
+                [model.objects.filter(publication_id=publication_id) for model in RELATED_CHANGE_MODELS]
+    timestamps = [queryset.aggregate(latest=Max('date_modified'))['latest'] for queryset in querysets]
+    timestamps.append(publication_change_log.last_changed(publication_id))
+    return max((t for t in timestamps if t is not None), default=None)
+
+
+def get_changed_publication_ids(since):
+    changed_ids = set(Publication.objects.filter(date_modified__gt=since).values_list('id', flat=True))
+    for model in RELATED_CHANGE_MODELS:
+        changed_ids.update(model.objects.filter(date_modified__gt=since).values_list('publication_id', flat=True))
+    changed_ids.update(publication_change_log.changed_since(since))
+    return changed_ids
+
+
+def upsert_related_df(related_df, changed_df, publication_ids):
+    """Replace the rows of related_df indexed by publication_ids with the rows in changed_df"""
+    categorical_columns = [c for c in related_df.columns if pd.api.types.is_categorical_dtype(related_df[c].dtype)]
+    df = pd.concat([related_df.loc[~related_df.index.isin(publication_ids)], changed_df], sort=False)
+    for column in categorical_columns:
+        df[column] = df[column].astype('category')
+    return df
+
+
+def get_df_size(df):
+    """In memory size of a dataframe in bytes"""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def compact_related_df(key, related_df):
+    """Apply the compact column types for key and report the in memory size before and after"""
+    before = get_df_size(related_df)
+    related_df = related_df.astype(COMPACT_DTYPES[key])
+    after = get_df_size(related_df)
+    logger.info('compacted %s from %s to %s bytes in memory', key, before, after)
+    metrics.gauge('visualization_cache.size.{}.memory'.format(key), after)
+    return related_df
+
+
+def build_many(keys, build, workers=1):
+    """Call build(key) for every key, concurrently in a pool of worker threads when workers > 1
+
+    Django gives each thread its own database connection, so the builders run as independent queries. The connections
+    are closed when each build finishes.
+    """
+    keys = sorted(keys)
+    if workers <= 1 or len(keys) <= 1:
+        return {key: build(key) for key in keys}
+
+    def _build(key):
+        try:
+            return build(key)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='visualization-cache') as executor:
+        return dict(zip(keys, executor.map(_build, keys)))
 
 
 class VisualizationCache:
+    """Versioned cache of the related dataframes
+
+    Every rebuild or refresh writes all of the frames under a new generation prefix and then flips the
+    ``visualization:generation`` pointer to it, so a reader never combines frames from different builds. Retired
+    generations are deleted once they are older than VISUALIZATION_CACHE_GENERATION_GRACE_PERIOD seconds.
+    """
     CREATE_RELATED_DF = {
         'authors': create_publication_author_df,
         'code_archive_urls': create_archive_url_df,
         'platforms': create_publication_platform_df,
         'publications': create_publication_df,
-        'sponsors': create_publication_sponsor_df
+        'sponsors': create_publication_sponsor_df,
+        'tags': create_publication_tag_df
     }
 
+    def __init__(self, snapshot_root=None):
+        self.snapshot = ColumnarSnapshot(snapshot_root) if snapshot_root else None
+        # deserialized frames held by this process, valid while the generation pointer equals _generation
+        self._generation = None
+        self._frames = {}
+        self._frames_lock = threading.Lock()
+        # frames from the previous generation, served while another worker rebuilds a missing generation
+        self._previous_frames = {}
+        self._position_index = None
+        self._timeseries_cube = None
+        self._entity_codes = None
+
+    @staticmethod
+    def get_frame_key(generation, key):
+        return VISUALIZATION_CACHE_FRAME_KEY.format(generation=generation, key=key)
+
+    @staticmethod
+    def get_generation():
+        return cache.get(VISUALIZATION_CACHE_GENERATION_KEY)
+
     def get_related(self, key):
-        related_df = cache.get(key, None)
-        return related_df
+        return self._get_many({key}).get(key)
 
-    def set_related(self, key, publication_queryset):
+    def create_related(self, key, publication_queryset):
         logger.info('preparing to cache %s', key)
         create_related_df = self.CREATE_RELATED_DF[key]
-        related_df = create_related_df(publication_queryset)
-        self.set(key, related_df)
-        logger.info('cached %s', key)
-        return related_df
+        with metrics.timer('visualization_cache.rebuild.{}'.format(key)):
+            related_df = create_related_df(publication_queryset)
+        return compact_related_df(key, related_df)
 
-    def set(self, key, related_df):
-        return cache.set(key, related_df)
+    @property
+    def connection(self):
+        return get_redis_connection('default')
 
-    def get_publications(self):
-        return self.get_or_create_many({'publications',})['publications']
+    def publish(self, frames, state=None):
+        """Write a complete set of frames under a new generation and atomically make it the current generation
 
-    def get_or_create_many(self, keys=None):
-        publication_queryset = create_publication_queryset()
+        The generation pointer only moves forward, so a build that finishes after a newer one was published retires
+        its own frames instead of replacing the newer generation.
+        """
+        cache.add(VISUALIZATION_CACHE_GENERATION_COUNTER_KEY, 0, None)
+        generation = cache.incr(VISUALIZATION_CACHE_GENERATION_COUNTER_KEY)
+        cache.set_many({self.get_frame_key(generation, key): df for key, df in frames.items()}, None)
+        # the snapshot is written before the pointer flips and only activated once this generation is current, readers
+        # check its stamp against the pointer and fall back to the django cache in between
+        snapshot_path = self.snapshot.create(frames, generation=generation) if self.snapshot else None
+        flipped, previous_generation = self._flip_generation(generation)
+        if not flipped:
+            logger.warning('visualization cache generation %s is older than the current generation %s, retiring it',
+                           generation, previous_generation)
+            self._retire(generation)
+            if snapshot_path:
+                self.snapshot.discard(snapshot_path)
+            return previous_generation
+        logger.info('published visualization cache generation %s', generation)
+        with self._frames_lock:
+            self._generation = generation
+            self._frames = dict(frames)
+        self._retire(previous_generation or None)
+        if snapshot_path:
+            self.snapshot.activate(snapshot_path)
+        if state is not None:
+            cache.set(VISUALIZATION_CACHE_STATE_KEY, state, None)
+        return generation
+
+    def _flip_generation(self, generation):
+        # integers are stored unpickled by django_redis, so the script can compare the cached generation directly
+        flip = self.connection.register_script(FLIP_GENERATION_SCRIPT)
+        flipped, previous_generation = flip(keys=[cache.make_key(VISUALIZATION_CACHE_GENERATION_KEY)],
+                                            args=[generation])
+        return bool(flipped), previous_generation
+
+    def _retire(self, generation):
+        """Schedule generation for deletion and delete the generations whose grace period has passed"""
+        connection = self.connection
+        retired_key = cache.make_key(VISUALIZATION_CACHE_RETIRED_GENERATIONS_KEY)
+        now = time.time()
+        if generation is not None:
+            connection.zadd(retired_key, {generation: now})
+        expired = [int(g) for g in connection.zrangebyscore(
+            retired_key, '-inf', now - settings.VISUALIZATION_CACHE_GENERATION_GRACE_PERIOD)]
+        if expired:
+            logger.info('deleting visualization cache generations %s', expired)
+            cache.delete_many([self.get_frame_key(g, key) for g in expired for key in self.CREATE_RELATED_DF])
+            connection.zrem(retired_key, *expired)
+
+    def get_position_index(self, publication_df):
+        """Position index over publication_df, built once for each generation of the publications frame"""
+        position_index = self._position_index
+        if position_index is None or position_index.publication_df is not publication_df:
+            position_index = PublicationPositionIndex(publication_df)
+            self._position_index = position_index
+        return position_index
+
+    def get_timeseries_cube(self, frames):
+        """Timeseries cube over frames, built once for each generation of the related dataframes"""
+        timeseries_cube = self._timeseries_cube
+        if timeseries_cube is None or not timeseries_cube.is_built_from(frames):
+            with metrics.timer('visualization_cache.build_timeseries_cube'):
+                timeseries_cube = TimeseriesCube(frames)
+            self._timeseries_cube = timeseries_cube
+        return timeseries_cube
+
+    def get_entity_codes(self, frames):
+        """Entity codes of every top count over frames, built once for each generation of the related dataframes"""
+        entity_codes = self._entity_codes
+        if entity_codes is None or any(codes.df is not frames[TOP_COUNT_COLUMNS[name][0]]
+                                       for name, codes in entity_codes.items()):
+            entity_codes = create_entity_codes(frames)
+            self._entity_codes = entity_codes
+        return entity_codes
+
+    def get_publications(self, columns=None):
+        columns = None if columns is None else {'publications': columns}
+        return self.get_or_create_many({'publications',}, columns=columns)['publications']
+
+    def get_or_create_many(self, keys=None, columns=None):
+        """Retrieve the related dataframes in keys, building a new generation if they are not cached
+
+        Frames are read from the memory mapped snapshot when it was written for the current generation, otherwise
+        from the current generation in the django cache.
+
+        :param columns: optional mapping of key to the columns needed. Only applies to frames read from the snapshot
+        """
         if keys is None:
-            keys = {'authors', 'code_archive_urls', 'platforms', 'publications', 'sponsors'}
-        results = cache.get_many(keys)
+            keys = set(self.CREATE_RELATED_DF)
+        results = {}
+        if self.snapshot:
+            generation = self.get_generation()
+            if generation is not None:
+                results = self.snapshot.read_many(keys, columns=columns, generation=generation)
+        missing_keys = keys.difference(results.keys())
+        if missing_keys:
+            results.update(self._get_many(missing_keys))
+        missing_keys = keys.difference(results.keys())
+        if missing_keys:
+            logger.info("missing_keys: %s", missing_keys)
+            results.update(self._create_missing(missing_keys))
+        return results
+
+    def _create_missing(self, keys):
+        """Rebuild a missing generation in at most one worker at a time
+
+        Other workers serve their copies of the frames from the previous generation if they have them, otherwise they
+        wait up to VISUALIZATION_CACHE_REBUILD_WAIT seconds for the rebuild to finish
+        """
+        lock = self._get_rebuild_lock()
+        previous_frames = self._previous_frames
+        has_previous = keys.issubset(previous_frames.keys())
+        with metrics.timer('visualization_cache.lock_wait'):
+            acquired = lock.acquire(blocking=not has_previous,
+                                    blocking_timeout=settings.VISUALIZATION_CACHE_REBUILD_WAIT)
+        if not acquired:
+            if has_previous:
+                metrics.incr('visualization_cache.served_previous')
+                return {key: previous_frames[key] for key in keys}
+            results = self._get_many(keys)
+            if keys.difference(results.keys()):
+                metrics.incr('visualization_cache.unavailable')
+                raise VisualizationCacheUnavailable(', '.join(sorted(keys)))
+            return results
+        try:
+            # another worker may have published a generation while this one was waiting
+            results = self._get_many(keys)
+            if keys.difference(results.keys()):
+                results = self.rebuild()
+            return {key: results[key] for key in keys}
+        finally:
+            self._release_rebuild_lock(lock)
+
+    @staticmethod
+    def _get_rebuild_lock():
+        return cache.lock(VISUALIZATION_CACHE_REBUILD_LOCK_KEY, timeout=settings.VISUALIZATION_CACHE_REBUILD_LOCK_TIMEOUT)
+
+    @staticmethod
+    def _release_rebuild_lock(lock):
+        try:
+            lock.release()
+        except LockError:
+            logger.warning('visualization cache rebuild lock expired before the rebuild finished')
+
+    @contextmanager
+    def rebuild_lock(self):
+        """Hold the rebuild lock, so one build or refresh at a time publishes a generation"""
+        lock = self._get_rebuild_lock()
+        with metrics.timer('visualization_cache.lock_wait'):
+            lock.acquire(blocking=True)
+        try:
+            yield
+        finally:
+            self._release_rebuild_lock(lock)
+
+    def _get_many(self, keys):
+        """Retrieve frames of the current generation from the local copies, only going to the django cache for the
+        large payloads when the generation has changed or a frame has not been fetched by this process yet"""
+        generation = self.get_generation()
+        frames = self._frames
+        if generation is None or generation != self._generation:
+            if frames:
+                self._previous_frames = frames
+            frames = {}
+        results = {key: frames[key] for key in keys if key in frames}
         missing_keys = keys.difference(results.keys())
-        logger.info("missing_keys: %s", missing_keys)
-        for key in sorted(missing_keys):
-            results[key] = self.set_related(key, publication_queryset)
+        if generation is not None and missing_keys:
+            cached = cache.get_many([self.get_frame_key(generation, key) for key in missing_keys])
+            results.update((key, cached[self.get_frame_key(generation, key)]) for key in missing_keys
+                           if self.get_frame_key(generation, key) in cached)
+            frames = dict(frames, **results)
+        with self._frames_lock:
+            self._generation = generation
+            self._frames = frames
+        return results
+
+    def rebuild(self, workers=None):
+        """Rebuild every related dataframe and publish them as a new generation
+
+        :param workers: number of frames to build concurrently, defaults to VISUALIZATION_CACHE_BUILD_WORKERS
+        """
+        state = {'version': get_version_stamp(), 'watermark': get_high_water_mark()}
+        publication_queryset = create_publication_queryset()
+        results = build_many(self.CREATE_RELATED_DF, lambda key: self.create_related(key, publication_queryset),
+                             workers=settings.VISUALIZATION_CACHE_BUILD_WORKERS if workers is None else workers)
+        self.publish(results, state)
+        return results
+
+    def refresh(self, full=False, workers=None):
+        """Bring the related dataframes up to date with the database
+
+        Only publications modified since the last recorded watermark are extracted again and upserted into the
+        existing frames. A full rebuild happens when no watermark has been recorded or the version stamp changed.
+        """
+        with self.rebuild_lock():
+            state = cache.get(VISUALIZATION_CACHE_STATE_KEY)
+            version = get_version_stamp()
+            if full or state is None or state['version'] != version or state['watermark'] is None:
+                logger.info('rebuilding visualization cache (state: %s, version: %s)', state, version)
+                return self.rebuild(workers=workers)
+            # the new watermark is read first so changes committed while the changed ids are read are picked up next
+            # time
+            watermark = get_high_water_mark()
+            return self._apply_changes(get_changed_publication_ids(state['watermark']),
+                                       state={'version': version, 'watermark': watermark}, workers=workers)
+
+    def apply_changes(self, publication_ids, state=None, workers=None):
+        """Extract the given publications again and publish a generation with their rows upserted or deleted in
+        every related dataframe"""
+        with self.rebuild_lock():
+            return self._apply_changes(publication_ids, state=state, workers=workers)
+
+    def _apply_changes(self, publication_ids, state=None, workers=None):
+        keys = set(self.CREATE_RELATED_DF)
+        # read from the current generation under the rebuild lock, so the changes are applied to the newest frames
+        results = self._get_many(keys)
+        if keys.difference(results.keys()):
+            logger.info('no complete visualization cache generation to apply changes to, rebuilding')
+            return self.rebuild(workers=workers)
+        publication_queryset = create_publication_queryset()
+        current_ids = set(publication_queryset.values_list('id', flat=True))
+        deleted_ids = set(results['publications'].index).difference(current_ids)
+        publication_ids = set(publication_ids).union(deleted_ids)
+        logger.info('refreshing %s publications in visualization cache', len(publication_ids))
+        if not publication_ids:
+            if state is not None:
+                cache.set(VISUALIZATION_CACHE_STATE_KEY, state, None)
+            return results
+        changed_queryset = publication_queryset.filter(id__in=publication_ids)
+
+        def _upsert(key):
+            related_df = upsert_related_df(results[key], self.CREATE_RELATED_DF[key](changed_queryset),
+                                           publication_ids)
+            return compact_related_df(key, related_df)
+
+        results = build_many(self.CREATE_RELATED_DF, _upsert,
+                             workers=settings.VISUALIZATION_CACHE_BUILD_WORKERS if workers is None else workers)
+        self.publish(results, state)
         return results
 
 
-def get_publication_pks_matching_search_criteria(query, facet_filters):
-    return [p.id for p in
-            PublicationDocSearch().find(q=query, facet_filters=facet_filters).source(['id']).scan()]
+def get_publication_pks_matching_search_criteria(query, facet_filters, fingerprint=None):
+    """Ids of the publications matching a normalized search"""
+    return get_matched_publication_ids(query, facet_filters, fingerprint=fingerprint)
 
 
-visualization_cache = VisualizationCache()
+visualization_cache = VisualizationCache(snapshot_root=settings.VISUALIZATION_SNAPSHOT_DIR)
@@ -23,8 +23,7 @@ def _create_count_dataframe(df):
 
 
 def create_publication_counts_dataset(query: Query):
-    publication_ids = [p.id for p in
-                       PublicationDocSearch().find(q=query.search, facet_filters=query.filters).source(['id']).scan()]
+    publication_ids = PublicationDocSearch().find(q=query.search, facet_filters=query.filters).scan_ids()
     publication_matches = data_cache.publications.loc[publication_ids]
     publication_match_counts = _create_count_dataframe(publication_matches).assign(group='matched')
     all_publication_counts = _create_count_dataframe(data_cache.publications).assign(group='all')
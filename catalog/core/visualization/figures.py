@@ -0,0 +1,40 @@
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class FigureTemplate:
+    """The to_plotly_json() output of a figure validated once, filled with the values of each plot
+
+    create_figure builds the figure with every trace it can contain, using placeholder values for the trace
+    properties that change between plots. Rendering copies the template traces with the new values instead of
+    validating a new go.Figure, so only the data arrays are handled per plot.
+    """
+
+    def __init__(self, create_figure):
+        self.create_figure = create_figure
+        self._figure_json = None
+
+    @property
+    def figure_json(self):
+        if self._figure_json is None:
+            self._figure_json = self.create_figure().to_plotly_json()
+        return self._figure_json
+
+    def render(self, traces):
+        """
+        :param traces: (index of the template trace, trace property values) pairs in the order they are plotted
+        """
+        template_traces = self.figure_json['data']
+        return {'data': [dict(template_traces[i], **values) for i, values in traces],
+                'layout': self.figure_json['layout']}
+
+
+class PlotJSONEncoder(DjangoJSONEncoder):
+    """Serializes numpy arrays and scalars as the lists and numbers to_plotly_json() output would contain"""
+
+    def default(self, o):
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
+        return super().default(o)
@@ -0,0 +1,183 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django_redis import get_redis_connection
+
+from catalog.core import metrics
+
+logger = logging.getLogger(__name__)
+
+VISUALIZATION_PLOT_REFRESH_LOCK_KEY = '{key}:refresh-lock'
+# the bookkeeping keys below are stored under the django cache key prefix
+# plot cache keys scored by their last access, for evicting the least recently used plots
+VISUALIZATION_PLOT_LRU_KEY = 'catalog:plot-cache:lru'
+# namespace and size in bytes of every resident plot
+VISUALIZATION_PLOT_ENTRIES_KEY = 'catalog:plot-cache:entries'
+# bytes held by the resident plots of each namespace
+VISUALIZATION_PLOT_BYTES_KEY = 'catalog:plot-cache:bytes'
+# misses of a plot that has not been admitted yet, expiring after VISUALIZATION_PLOT_CACHE_ADMISSION_WINDOW seconds
+VISUALIZATION_PLOT_MISSES_KEY = 'catalog:plot-cache:misses:{key}'
+
+# replaces the size accounted for plot ARGV[1] with ARGV[3] bytes under namespace ARGV[2] and marks it as used at
+# ARGV[4]. Runs atomically so concurrent stores of the same plot never account for its bytes twice
+ACCOUNT_SCRIPT = '''
+local previous = redis.call('hget', KEYS[1], ARGV[1])
+if previous then
+    local entry = cjson.decode(previous)
+    redis.call('hincrby', KEYS[2], entry[1], -entry[2])
+end
+redis.call('hset', KEYS[1], ARGV[1], cjson.encode({ARGV[2], tonumber(ARGV[3])}))
+redis.call('hincrby', KEYS[2], ARGV[2], ARGV[3])
+redis.call('zadd', KEYS[3], ARGV[4], ARGV[1])
+'''
+# pops the least recently used plots until the plots of every namespace together hold at most ARGV[1] bytes and
+# returns the keys of the evicted plots
+EVICT_SCRIPT = '''
+local total = 0
+for _, size in ipairs(redis.call('hvals', KEYS[2])) do
+    total = total + tonumber(size)
+end
+local evicted = {}
+while total > tonumber(ARGV[1]) do
+    local popped = redis.call('zpopmin', KEYS[3])
+    if #popped == 0 then
+        break
+    end
+    local key = popped[1]
+    local entry = redis.call('hget', KEYS[1], key)
+    if entry then
+        entry = cjson.decode(entry)
+        redis.call('hincrby', KEYS[2], entry[1], -entry[2])
+        redis.call('hdel', KEYS[1], key)
+        total = total - entry[2]
+    end
+    table.insert(evicted, key)
+end
+return evicted
+'''
+
+
+class PlotCache:
+    """Cache of rendered visualization plots with a soft and a hard expiry
+
+    Entries are stored with the time of their soft expiry and kept for VISUALIZATION_PLOT_CACHE_HARD_TIMEOUT seconds.
+    A fresh entry is served as is. A stale entry, past its soft expiry of VISUALIZATION_PLOT_CACHE_SOFT_TIMEOUT
+    seconds, is still served immediately while a single background refresh recomputes it, so only requests for plots
+    that are missing or past their hard expiry wait on the computation.
+
+    When VISUALIZATION_PLOT_CACHE_MAX_BYTES is set, a plot is only stored once it has missed
+    VISUALIZATION_PLOT_CACHE_ADMIT_AFTER times within the admission window, so one-off facet combinations don't displace
+    popular plots, and the least recently used plots are evicted whenever the resident plots of every namespace hold
+    more than VISUALIZATION_PLOT_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self):
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=settings.VISUALIZATION_PLOT_REFRESH_WORKERS,
+                                                thread_name_prefix='visualization-plot-refresh')
+        return self._executor
+
+    @property
+    def connection(self):
+        return get_redis_connection('default')
+
+    @property
+    def is_bounded(self):
+        return settings.VISUALIZATION_PLOT_CACHE_MAX_BYTES is not None
+
+    def set(self, key, value, namespace):
+        cache.set(key, (value, time.time() + settings.VISUALIZATION_PLOT_CACHE_SOFT_TIMEOUT),
+                  settings.VISUALIZATION_PLOT_CACHE_HARD_TIMEOUT)
+        if self.is_bounded:
+            self._account(key, namespace, len(value))
+            self._evict()
+
+    def get_or_compute(self, key, compute, namespace):
+        """The cached value of key, computing it with compute() when it is missing
+
+        :param namespace: name the bytes held by the entry are accounted under
+        """
+        entry = cache.get(key)
+        if not isinstance(entry, tuple):
+            # plots cached before entries carried their soft expiry are plain json strings
+            entry = None
+        metrics.record_hit('visualization.plot_cache', entry is not None)
+        if entry is None:
+            value = compute()
+            if self._admit(key):
+                self.set(key, value, namespace)
+            return value
+        if self.is_bounded:
+            self.connection.zadd(cache.make_key(VISUALIZATION_PLOT_LRU_KEY), {key: time.time()}, xx=True)
+        value, soft_expires_at = entry
+        if time.time() >= soft_expires_at:
+            metrics.incr('visualization.plot_cache.stale')
+            self.refresh_in_background(key, compute, namespace)
+        return value
+
+    def refresh_in_background(self, key, compute, namespace):
+        """Recompute key in the refresh pool unless another request is already refreshing it"""
+        lock_key = VISUALIZATION_PLOT_REFRESH_LOCK_KEY.format(key=key)
+        if cache.add(lock_key, True, settings.VISUALIZATION_PLOT_REFRESH_LOCK_TIMEOUT):
+            self.executor.submit(self._refresh, key, compute, namespace, lock_key)
+
+    def _refresh(self, key, compute, namespace, lock_key):
+        try:
+            with metrics.timer('visualization.plot_cache.refresh'):
+                self.set(key, compute(), namespace)
+        except Exception:
+            logger.exception('refreshing visualization plot %s failed', key)
+        finally:
+            cache.delete(lock_key)
+            connections.close_all()
+
+    def _admit(self, key):
+        """Count a miss of key and whether it has now missed often enough to be stored"""
+        if not self.is_bounded or settings.VISUALIZATION_PLOT_CACHE_ADMIT_AFTER <= 1:
+            return True
+        misses_key = cache.make_key(VISUALIZATION_PLOT_MISSES_KEY.format(key=key))
+        with self.connection.pipeline() as pipeline:
+            pipeline.incr(misses_key)
+            pipeline.expire(misses_key, settings.VISUALIZATION_PLOT_CACHE_ADMISSION_WINDOW)
+            misses, _ = pipeline.execute()
+        admitted = misses >= settings.VISUALIZATION_PLOT_CACHE_ADMIT_AFTER
+        if not admitted:
+            metrics.incr('visualization.plot_cache.not_admitted')
+        return admitted
+
+    @staticmethod
+    def _accounting_keys():
+        return [cache.make_key(key)
+                for key in (VISUALIZATION_PLOT_ENTRIES_KEY, VISUALIZATION_PLOT_BYTES_KEY, VISUALIZATION_PLOT_LRU_KEY)]
+
+    def _account(self, key, namespace, size):
+        account = self.connection.register_script(ACCOUNT_SCRIPT)
+        account(keys=self._accounting_keys(), args=[key, namespace, size, time.time()])
+
+    def _evict(self):
+        """Evict the least recently used plots until every namespace together fits in the byte budget
+
+        Plots that already reached their hard expiry are still accounted for until they are evicted, and being the
+        least recently used they are evicted first.
+        """
+        evict = self.connection.register_script(EVICT_SCRIPT)
+        evicted = evict(keys=self._accounting_keys(), args=[settings.VISUALIZATION_PLOT_CACHE_MAX_BYTES])
+        if evicted:
+            cache.delete_many([key.decode('utf-8') for key in evicted])
+            metrics.incr('visualization.plot_cache.evicted', len(evicted))
+
+    def get_namespace_bytes(self):
+        """Bytes held by the resident plots of each namespace"""
+        return {namespace.decode('utf-8'): int(size)
+                for namespace, size in self.connection.hgetall(cache.make_key(VISUALIZATION_PLOT_BYTES_KEY)).items()}
+
+
+plot_cache = PlotCache()
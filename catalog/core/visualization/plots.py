@@ -7,6 +7,7 @@ from django.db.models.functions import Concat
 from plotly.subplots import make_subplots
 
 from citation.models import Publication, CodeArchiveUrl, Author
+from .figures import FigureTemplate
 
 
 def get_publication_queryset(pks):
@@ -98,282 +99,127 @@ def programming_platform_count_plot():
     return count_bar_plot(records=platform_counts, title='Most Popular Platforms')
 
 
-def code_availability_timeseries_plot(publication_df: pd.DataFrame, publication_pks=None):
-    if publication_pks is not None:
-        publication_df = publication_df.loc[publication_df.index.intersection(publication_pks)]
-    df = publication_df.groupby('year_published') \
-        .agg({'year_published': ['count'], 'has_available_code': ['sum', 'mean']}) \
-        .reindex(pd.RangeIndex(1990.0, publication_df['year_published'].max() + 1.0), fill_value=0.0)
-    year = list(df.index)
-    count_data = [
-        go.Scatter(
-            x=year,
-            y=df[('has_available_code', 'sum')].to_list(),
-            name='Available Code'
-        ),
-        go.Scatter(
-            x=year,
-            y=df[('year_published','count')].to_list(),
-            name='Total'
-        )
-    ]
-    count_layout = go.Layout(
-        legend=go.Legend(orientation='h'),
-        title='Publication Code Availability',
-        yaxis=go.layout.YAxis(title='Count'),
-        xaxis=go.layout.XAxis(title='Year')
-    )
-    count_figure = go.Figure(data=count_data, layout=count_layout)
-
-    percent_data = [
-        go.Scatter(
-            x=year,
-            y=df[('has_available_code', 'mean')].to_list()
-        )
-    ]
-    percent_layout = go.Layout(
-        legend=go.Legend(orientation='h'),
-        title='Publication Code Availability (Proportion)',
-        yaxis=go.layout.YAxis(title='Proportion'),
-        xaxis=go.layout.XAxis(title='Year')
-    )
-    percent_figure = go.Figure(data=percent_data, layout=percent_layout)
-
-    return {
-        'count': count_figure,
-        'percent': percent_figure
-    }
-
-
-def archival_timeseries_plot(publication_df: pd.DataFrame, code_archive_urls_df: pd.DataFrame, publication_pks):
-    matching_publication_df = publication_df.loc[publication_df.index.intersection(publication_pks)]
-    year_published_index = pd.RangeIndex(1990.0, publication_df['year_published'].max() + 1.0)
-    year_counts_df = matching_publication_df \
-        .groupby(['year_published'])[['year_published']] \
-        .count() \
-        .rename(columns={'year_published': ('publications', 'count')}) \
-        .reindex(year_published_index) \
-        .fillna(0.0)
-    df = matching_publication_df \
-        .join(code_archive_urls_df) \
-        .groupby(['category', 'year_published'])[['category']] \
-        .count() \
-        .unstack('category') \
-        .reindex(year_published_index) \
-        .fillna(0.0) \
-        .join(year_counts_df)
-
-    df_percent = df.apply(lambda x: x / x[('publications', 'count')], axis=1)['category'].fillna(0.0)
-
-    year = list(df.index)
-    count_data = []
-    percent_data = []
-    for var_name in df_percent.keys():
-        count_data.append(
-            go.Scatter(
-                x=year,
-                y=list(df[('category', var_name)]),
-                name=var_name
-            )
-        )
-        percent_data.append(
-            go.Scatter(
-                x=year,
-                y=list(df_percent[var_name]),
-                name=var_name
-            )
-        )
-    count_data.append(go.Scatter(
-        x=year,
-        y=list(df[('publications', 'count')]),
-        name='Total',
-        visible='legendonly'
-    ))
-
-    count_timeseries = go.Figure(
-        data=count_data,
-        layout=go.Layout(
-            title='Archival Location (Count)',
-            xaxis=go.layout.XAxis(title='Year'),
-            yaxis=go.layout.YAxis(title='Count')
-        )
-    )
-
-    percent_timeseries = go.Figure(
-        data=percent_data,
+def _timeseries_figure(traces, title, yaxis_title, **layout):
+    return go.Figure(
+        data=[go.Scatter(x=[], y=[], **trace) for trace in traces],
         layout=go.Layout(
-            title='Archival Location (Proportion)',
+            title=title,
             xaxis=go.layout.XAxis(title='Year'),
-            yaxis=go.layout.YAxis(title='Proportion')
+            yaxis=go.layout.YAxis(title=yaxis_title),
+            **layout
         )
     )
-    return {'count': count_timeseries, 'percent': percent_timeseries}
-
-
-def documentation_standards_timeseries_plot(publication_df: pd.DataFrame, publication_pks):
-    year_published_index = pd.RangeIndex(1990.0, publication_df['year_published'].max() + 1.0)
-    matching_publication_df = publication_df.reindex(publication_pks)
-    df = matching_publication_df \
-        .groupby('year_published') \
-        .agg({'year_published': ['count'],
-              'has_flow_charts': ['mean', 'sum'],
-              'has_math_description': ['mean', 'sum'],
-              'has_odd': ['mean', 'sum'],
-              'has_pseudocode': ['mean', 'sum']}) \
-        .rename(columns={'year_published': 'count'}) \
-        .reindex(year_published_index, fill_value=0.0)
 
-    year = list(df.index)
-
-    count_timeseries = go.Figure(
-        data=[
-            go.Scatter(
-                x=year,
-                y=list(df[('has_flow_charts', 'sum')]),
-                name='Flow Charts'
-            ),
-            go.Scatter(
-                x=year,
-                y=list(df[('has_math_description', 'sum')]),
-                name='Math Description'
-            ),
-            go.Scatter(
-                x=year,
-                y=list(df[('has_odd', 'sum')]),
-                name='ODD'
-            ),
-            go.Scatter(
-                x=year,
-                y=list(df[('has_pseudocode', 'sum')]),
-                name='Pseudocode'
-            ),
-            go.Scatter(
-                x=year,
-                y=list(df[('count', 'count')]),
-                name='Total'
-            ),
-        ],
 
+def _top_count_figure(title):
+    return go.Figure(
+        data=[go.Bar(x=[], y=[])],
         layout=go.Layout(
-            title='Documentation Techniques and Standards (Count)',
-            xaxis=go.layout.XAxis(title='Year'),
-            yaxis=go.layout.YAxis(title='Count')
+            title=title,
+            yaxis=go.layout.YAxis(title='# of publications')
         )
     )
 
-    percent_timeseries = go.Figure(
-        data=[
-            go.Scatter(
-                x=year,
-                y=list(df[('has_flow_charts', 'mean')]),
-                name='Flow Charts'
-            ),
-            go.Scatter(
-                x=year,
-                y=list(df[('has_math_description', 'mean')]),
-                name='Math Description'
-            ),
-            go.Scatter(
-                x=year,
-                y=list(df[('has_odd', 'mean')]),
-                name='ODD'
-            ),
-            go.Scatter(
-                x=year,
-                y=list(df[('has_pseudocode', 'mean')]),
-                name='Pseudocode'
-            )
-        ],
 
-        layout=go.Layout(
-            title='Documentation Techniques and Standards (Proportion)',
-            xaxis=go.layout.XAxis(title='Year'),
-            yaxis=go.layout.YAxis(title='Proportion')
-        )
-    )
+CODE_AVAILABILITY_COUNT_TEMPLATE = FigureTemplate(lambda: _timeseries_figure(
+    [{'name': 'Available Code'}, {'name': 'Total'}], 'Publication Code Availability', 'Count',
+    legend=go.Legend(orientation='h')))
+CODE_AVAILABILITY_PERCENT_TEMPLATE = FigureTemplate(lambda: _timeseries_figure(
+    [{}], 'Publication Code Availability (Proportion)', 'Proportion', legend=go.Legend(orientation='h')))
+# one trace repeated for every archive category followed by the hidden total
+ARCHIVAL_COUNT_TEMPLATE = FigureTemplate(lambda: _timeseries_figure(
+    [{'name': ''}, {'name': 'Total', 'visible': 'legendonly'}], 'Archival Location (Count)', 'Count'))
+ARCHIVAL_PERCENT_TEMPLATE = FigureTemplate(lambda: _timeseries_figure(
+    [{'name': ''}], 'Archival Location (Proportion)', 'Proportion'))
+DOCUMENTATION_STANDARDS_NAMES = {
+    'has_flow_charts': 'Flow Charts',
+    'has_math_description': 'Math Description',
+    'has_odd': 'ODD',
+    'has_pseudocode': 'Pseudocode',
+}
+DOCUMENTATION_STANDARDS_COUNT_TEMPLATE = FigureTemplate(lambda: _timeseries_figure(
+    [{'name': name} for name in list(DOCUMENTATION_STANDARDS_NAMES.values()) + ['Total']],
+    'Documentation Techniques and Standards (Count)', 'Count'))
+DOCUMENTATION_STANDARDS_PERCENT_TEMPLATE = FigureTemplate(lambda: _timeseries_figure(
+    [{'name': name} for name in DOCUMENTATION_STANDARDS_NAMES.values()],
+    'Documentation Techniques and Standards (Proportion)', 'Proportion'))
+TOP_AUTHOR_TEMPLATE = FigureTemplate(lambda: _top_count_figure('Top 10 most published authors'))
+TOP_JOURNAL_TEMPLATE = FigureTemplate(lambda: _top_count_figure('Top 10 most published journals'))
+TOP_PLATFORM_TEMPLATE = FigureTemplate(lambda: _top_count_figure('Top 10 most popular platforms'))
+TOP_SPONSOR_TEMPLATE = FigureTemplate(lambda: _top_count_figure('Top 10 sponsors'))
+
+
+def code_availability_timeseries_plot(df: pd.DataFrame):
+    year = df.index.values
+    return {
+        'count': CODE_AVAILABILITY_COUNT_TEMPLATE.render([
+            (0, {'x': year, 'y': df[('has_available_code', 'sum')].values}),
+            (1, {'x': year, 'y': df[('year_published', 'count')].values}),
+        ]),
+        'percent': CODE_AVAILABILITY_PERCENT_TEMPLATE.render([
+            (0, {'x': year, 'y': df[('has_available_code', 'mean')].values}),
+        ])
+    }
 
-    return {'count': count_timeseries, 'percent': percent_timeseries}
 
+def archival_timeseries_plot(df: pd.DataFrame, df_percent: pd.DataFrame):
+    year = df.index.values
+    count_traces = [(0, {'name': var_name, 'x': year, 'y': df[('category', var_name)].values})
+                    for var_name in df_percent.keys()]
+    count_traces.append((1, {'x': year, 'y': df[('publications', 'count')].values}))
+    percent_traces = [(0, {'name': var_name, 'x': year, 'y': df_percent[var_name].values})
+                      for var_name in df_percent.keys()]
+    return {'count': ARCHIVAL_COUNT_TEMPLATE.render(count_traces),
+            'percent': ARCHIVAL_PERCENT_TEMPLATE.render(percent_traces)}
 
-def top_author_plot(publication_author_df, publication_pks):
-    matching_authors_df = publication_author_df.loc[publication_author_df.index.intersection(publication_pks)]
-    df = matching_authors_df.groupby('author_id') \
-             .agg({'name': ['first', 'count']}) \
-             .sort_values(by=('name', 'count'), ascending=False).iloc[:10]
 
-    data = [
-        go.Bar(
-            x=df.loc[:, ('name', 'first')].to_list(),
-            y=df.loc[:, ('name', 'count')].to_list(),
-        )
-    ]
+def documentation_standards_timeseries_plot(df: pd.DataFrame):
+    year = df.index.values
+    count_traces = [(i, {'x': year, 'y': df[(column, 'sum')].values})
+                    for i, column in enumerate(DOCUMENTATION_STANDARDS_NAMES)]
+    count_traces.append((len(count_traces), {'x': year, 'y': df[('count', 'count')].values}))
+    percent_traces = [(i, {'x': year, 'y': df[(column, 'mean')].values})
+                      for i, column in enumerate(DOCUMENTATION_STANDARDS_NAMES)]
+    return {'count': DOCUMENTATION_STANDARDS_COUNT_TEMPLATE.render(count_traces),
+            'percent': DOCUMENTATION_STANDARDS_PERCENT_TEMPLATE.render(percent_traces)}
 
-    layout = go.Layout(
-        title='Top 10 most published authors',
-        yaxis=go.layout.YAxis(title='# of publications')
-    )
 
-    return go.Figure(data=data, layout=layout)
+def _top_count_plot(template, df: pd.DataFrame):
+    return template.render([(0, {'x': df['name'].values, 'y': df['count'].values})])
 
 
-def top_journal_plot(container_df, publication_pks):
-    matching_container_df = container_df.loc[container_df.index.intersection(publication_pks)]
-    df = matching_container_df.groupby('container_id') \
-             .agg({'container_name': ['first'], 'container_id': ['count']}) \
-             .sort_values(by=('container_id', 'count'), ascending=False).iloc[:10]
+def top_author_plot(df: pd.DataFrame):
+    return _top_count_plot(TOP_AUTHOR_TEMPLATE, df)
 
-    data = [
-        go.Bar(
-            x=df.loc[:, ('container_name', 'first')].to_list(),
-            y=df.loc[:, ('container_id', 'count')].to_list(),
-        )
-    ]
 
-    layout = go.Layout(
-        title='Top 10 most published journals',
-        yaxis=go.layout.YAxis(title='# of publications')
-    )
+def top_journal_plot(df: pd.DataFrame):
+    return _top_count_plot(TOP_JOURNAL_TEMPLATE, df)
 
-    return go.Figure(data=data, layout=layout)
 
+def top_platform_plot(df: pd.DataFrame):
+    return _top_count_plot(TOP_PLATFORM_TEMPLATE, df)
 
-def top_platform_plot(publication_platform_df, publication_pks):
-    matching_platform_df = publication_platform_df.loc[publication_platform_df.index.intersection(publication_pks)]
-    df = matching_platform_df.groupby('platform_id') \
-        .agg({'platform_id': ['count'], 'platform_name': ['first']}) \
-        .sort_values(by=('platform_id', 'count'), ascending=False).iloc[:10]
 
-    data = [
-        go.Bar(
-            x=df.loc[:, ('platform_name', 'first')].to_list(),
-            y=df.loc[:, ('platform_id', 'count')].to_list()
-        )
-    ]
+def top_sponsor_plot(df: pd.DataFrame):
+    return _top_count_plot(TOP_SPONSOR_TEMPLATE, df)
 
-    layout = go.Layout(
-        title='Top 10 most popular platforms',
-        yaxis=go.layout.YAxis(title='# of publications')
-    )
 
-    return go.Figure(data=data, layout=layout)
+# aggregate and renderer of each family of plots served by the visualization plot endpoint
+PLOT_FAMILIES = {
+    'archival-timeseries': ('archival', lambda dfs: archival_timeseries_plot(*dfs)),
+    'code-availability-timeseries': ('code_availability', code_availability_timeseries_plot),
+    'documentation-timeseries': ('documentation_standards', documentation_standards_timeseries_plot),
+    'top-author': ('top_authors', top_author_plot),
+    'top-journal': ('top_journals', top_journal_plot),
+    'top-platform': ('top_platforms', top_platform_plot),
+    'top-sponsor': ('top_sponsors', top_sponsor_plot),
+}
 
 
-def top_sponsor_plot(publication_sponsor_df, publication_pks):
-    matching_sponsor_df = publication_sponsor_df.loc[publication_sponsor_df.index.intersection(publication_pks)]
-    df = matching_sponsor_df.groupby('sponsor_id') \
-        .agg({'sponsor_id': ['count'], 'sponsor_name': ['first']}) \
-        .sort_values(by=('sponsor_id', 'count'), ascending=False).iloc[:10]
-
-    data = [
-        go.Bar(
-            x=df.loc[:, ('sponsor_name', 'first')].to_list(),
-            y=df.loc[:, ('sponsor_id', 'count')].to_list()
-        )
-    ]
-
-    layout = go.Layout(
-        title='Top 10 sponsors',
-        yaxis=go.layout.YAxis(title='# of publications')
-    )
-
-    return go.Figure(data=data, layout=layout)
\ No newline at end of file
+def render_plot_family(name, aggregate):
+    """Plots of a family keyed by the id of the element each one is drawn in"""
+    _, render = PLOT_FAMILIES[name]
+    figures = render(aggregate)
+    if name.startswith('top-'):
+        return {'{}-plot'.format(name): figures}
+    return {'{}-{}-plot'.format(name, kind): figure for kind, figure in figures.items()}
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+
+class PublicationPositionIndex:
+    """Dense index from publication id to row offset in a cached publications frame
+
+    Built once per cache generation. Sets of matching publication ids become boolean masks over the publications
+    frame and, through the precomputed publication offset of every related row, over the related frames. Masks for
+    different facets can be combined with ``&`` and ``|``.
+    """
+
+    def __init__(self, publication_df: pd.DataFrame):
+        self.publication_df = publication_df
+        publication_ids = np.asarray(publication_df.index, dtype=np.int64)
+        self.size = len(publication_ids)
+        self._order = np.argsort(publication_ids, kind='mergesort')
+        self._sorted_ids = publication_ids[self._order]
+        self._related_offsets = {}
+
+    def offsets(self, publication_ids):
+        """Row offsets of publication_ids in the publications frame, -1 for ids that are not in the frame"""
+        publication_ids = np.asarray(publication_ids, dtype=np.int64)
+        if not self.size:
+            return np.full(len(publication_ids), -1, dtype=np.int64)
+        positions = np.searchsorted(self._sorted_ids, publication_ids).clip(max=self.size - 1)
+        return np.where(self._sorted_ids[positions] == publication_ids, self._order[positions], -1)
+
+    def mask(self, publication_ids=None):
+        """Boolean mask over the publications frame of the rows in publication_ids, every row if it is None"""
+        if publication_ids is None:
+            return np.ones(self.size, dtype=bool)
+        offsets = self.offsets(publication_ids)
+        mask = np.zeros(self.size, dtype=bool)
+        mask[offsets[offsets >= 0]] = True
+        return mask
+
+    def related_mask(self, key, related_df: pd.DataFrame, mask):
+        """Boolean mask over the rows of a frame indexed by publication id whose publication is set in mask"""
+        cached = self._related_offsets.get(key)
+        if cached is None or cached[0] is not related_df:
+            cached = (related_df, self.offsets(related_df.index))
+            self._related_offsets[key] = cached
+        offsets = cached[1]
+        return (offsets >= 0) & mask[offsets]
@@ -0,0 +1,211 @@
+"""
+On disk columnar snapshots of the visualization dataframes
+
+A snapshot is a directory with one subdirectory per dataframe and one ``.npy`` file per column. Categorical and string
+columns are dictionary encoded as integer codes plus a fixed width unicode array of categories, dates are stored as
+datetime64 and nullable integer columns are stored as values plus a mask so every file can be memory mapped read only.
+Each column is read back with the dtype it was written with. Readers follow the ``current`` symlink in
+the snapshot root which is swapped with ``os.replace`` once a new snapshot has been completely written. A snapshot is
+stamped with the visualization cache generation it was written for, so readers can tell whether it is still current.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.core.internals import BlockManager, make_block
+
+logger = logging.getLogger(__name__)
+
+CURRENT_LINK_NAME = 'current'
+GENERATION_FILE_NAME = 'generation.json'
+METADATA_FILE_NAME = 'metadata.json'
+SNAPSHOT_PREFIX = 'snapshot-'
+
+
+def _write_array(frame_dir, file_name, values):
+    np.save(os.path.join(frame_dir, file_name), values, allow_pickle=False)
+    return file_name
+
+
+def _write_column(frame_dir, position, name, series: pd.Series):
+    file_name = '{}.npy'.format(position)
+    if series.dtype == object:
+        inferred_dtype = pd.api.types.infer_dtype(series, skipna=True)
+        if inferred_dtype in ('date', 'datetime'):
+            unit = 'D' if inferred_dtype == 'date' else 'us'
+            values = np.array([np.datetime64('NaT') if pd.isnull(v) else v for v in series],
+                              dtype='datetime64[{}]'.format(unit))
+            return {'name': name, 'kind': 'date', 'file': _write_array(frame_dir, file_name, values)}
+        if inferred_dtype not in ('string', 'empty'):
+            raise TypeError('cannot snapshot object column {} holding {} values'.format(name, inferred_dtype))
+        codes, categories = pd.factorize(series)
+        return {'name': name, 'kind': 'object',
+                'file': _write_array(frame_dir, file_name, codes.astype(np.int32)),
+                'categories': _write_array(frame_dir, '{}.categories.npy'.format(position),
+                                           np.asarray(categories, dtype=str))}
+    if pd.api.types.is_extension_array_dtype(series.dtype) and pd.api.types.is_integer_dtype(series.dtype):
+        return {'name': name, 'kind': 'nullable',
+                'file': _write_array(frame_dir, file_name,
+                                     series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)),
+                'mask': _write_array(frame_dir, '{}.mask.npy'.format(position), series.isna().to_numpy())}
+    if pd.api.types.is_categorical_dtype(series.dtype):
+        categories = np.asarray(series.cat.categories.astype(str), dtype=str)
+        return {'name': name, 'kind': 'categorical',
+                'file': _write_array(frame_dir, file_name, series.cat.codes.to_numpy()),
+                'categories': _write_array(frame_dir, '{}.categories.npy'.format(position), categories)}
+    return {'name': name, 'kind': 'array', 'file': _write_array(frame_dir, file_name, series.to_numpy())}
+
+
+def write_frame(frame_dir, df: pd.DataFrame):
+    os.makedirs(frame_dir)
+    metadata = {
+        'index': _write_column(frame_dir, 'index', df.index.name, df.index.to_series()),
+        'columns': [_write_column(frame_dir, position, name, df[name]) for position, name in enumerate(df.columns)]
+    }
+    with open(os.path.join(frame_dir, METADATA_FILE_NAME), 'w') as f:
+        json.dump(metadata, f)
+
+
+def _read_column(frame_dir, column):
+    values = np.load(os.path.join(frame_dir, column['file']), mmap_mode='r', allow_pickle=False)
+    if column['kind'] == 'categorical':
+        categories = np.load(os.path.join(frame_dir, column['categories']), allow_pickle=False)
+        return pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(categories))
+    if column['kind'] == 'nullable':
+        mask = np.load(os.path.join(frame_dir, column['mask']), mmap_mode='r', allow_pickle=False)
+        return pd.arrays.IntegerArray(values, mask)
+    # python objects can't be mapped, so object columns are the only ones materialized in each process
+    if column['kind'] == 'object':
+        categories = np.load(os.path.join(frame_dir, column['categories']), allow_pickle=False)
+        objects = np.append(categories.astype(object), None)
+        return objects[values]
+    if column['kind'] == 'date':
+        return values.astype(object)
+    return values
+
+
+def _create_block(values, position):
+    # numpy blocks are two dimensional, reshaping the mapped column is a view of the same pages
+    if isinstance(values, np.ndarray):
+        values = values.reshape(1, -1)
+    return make_block(values, placement=[position], ndim=2)
+
+
+def read_frame(frame_dir, columns=None):
+    """Frame with the columns of the snapshot in frame_dir
+
+    The frame is assembled from one block per column instead of letting the DataFrame constructor consolidate columns
+    of the same dtype into a new block, so numeric, boolean, nullable and categorical columns keep pointing at the
+    memory mapped files and their pages are shared by every process reading the snapshot. Object columns are
+    materialized in each process.
+    """
+    with open(os.path.join(frame_dir, METADATA_FILE_NAME)) as f:
+        metadata = json.load(f)
+    index_column = metadata['index']
+    selected = [c for c in metadata['columns'] if columns is None or c['name'] in columns]
+    index = pd.Index(_read_column(frame_dir, index_column), name=index_column['name'])
+    blocks = [_create_block(_read_column(frame_dir, c), position) for position, c in enumerate(selected)]
+    return pd.DataFrame(BlockManager(blocks, [pd.Index([c['name'] for c in selected]), index]))
+
+
+class ColumnarSnapshot:
+    """Reads and writes visualization dataframe snapshots under ``root``
+
+    Each process keeps the frames it has read from the current snapshot and drops them when the ``current`` symlink
+    points at a new snapshot
+    """
+
+    def __init__(self, root, keep=2):
+        self.root = root
+        self.keep = keep
+        self._path = None
+        self._generation = None
+        self._frames = {}
+
+    @property
+    def current_link(self):
+        return os.path.join(self.root, CURRENT_LINK_NAME)
+
+    def current_path(self):
+        try:
+            return os.path.join(self.root, os.readlink(self.current_link))
+        except OSError:
+            return None
+
+    def create(self, dfs, generation=None):
+        """Write dfs to a new snapshot directory stamped with generation without making it the current snapshot"""
+        os.makedirs(self.root, exist_ok=True)
+        path = tempfile.mkdtemp(prefix=SNAPSHOT_PREFIX, dir=self.root)
+        os.chmod(path, 0o755)
+        for key, df in dfs.items():
+            write_frame(os.path.join(path, key), df)
+        with open(os.path.join(path, GENERATION_FILE_NAME), 'w') as f:
+            json.dump({'generation': generation}, f)
+        return path
+
+    def activate(self, path):
+        """Make the snapshot at path the current snapshot"""
+        tmp_link = os.path.join(self.root, '{}.{}'.format(CURRENT_LINK_NAME, os.getpid()))
+        os.symlink(os.path.basename(path), tmp_link)
+        os.replace(tmp_link, self.current_link)
+        logger.info('activated visualization snapshot %s', path)
+        self.prune()
+
+    @staticmethod
+    def discard(path):
+        shutil.rmtree(path, ignore_errors=True)
+
+    def write(self, dfs, generation=None):
+        path = self.create(dfs, generation=generation)
+        self.activate(path)
+        return path
+
+    def prune(self):
+        """Remove all but the newest ``keep`` snapshots. Readers that still map an old snapshot keep their pages"""
+        snapshots = sorted((os.path.join(self.root, name) for name in os.listdir(self.root)
+                            if name.startswith(SNAPSHOT_PREFIX)), key=os.path.getmtime, reverse=True)
+        current_path = self.current_path()
+        for path in snapshots[self.keep:]:
+            if path != current_path:
+                shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def read_generation(path):
+        try:
+            with open(os.path.join(path, GENERATION_FILE_NAME)) as f:
+                return json.load(f)['generation']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def read_many(self, keys, columns=None, generation=None):
+        """Return the frames in ``keys`` available in the current snapshot
+
+        :param columns: optional mapping of key to the column names to load for that key
+        :param generation: only return frames if the current snapshot was written for this generation
+        """
+        path = self.current_path()
+        if path is None:
+            return {}
+        if path != self._path:
+            logger.info('loading visualization snapshot %s', path)
+            self._path = path
+            self._generation = self.read_generation(path)
+            self._frames = {}
+        if generation is not None and self._generation != generation:
+            return {}
+        columns = {} if columns is None else columns
+        results = {}
+        for key in keys:
+            key_columns = columns.get(key)
+            cache_key = (key, None if key_columns is None else tuple(sorted(key_columns)))
+            if cache_key not in self._frames:
+                frame_dir = os.path.join(path, key)
+                if not os.path.isdir(frame_dir):
+                    continue
+                self._frames[cache_key] = read_frame(frame_dir, columns=key_columns)
+            results[key] = self._frames[cache_key]
+        return results
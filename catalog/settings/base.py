@@ -37,6 +37,38 @@ MANAGERS = ADMINS
 
 DATA_DIR = 'data'
 
+# memory mapped columnar snapshots of the visualization dataframes, written by populate_visualization_cache
+VISUALIZATION_SNAPSHOT_DIR = '/shared/catalog/visualization'
+# seconds a retired visualization cache generation is kept for readers that still reference it
+VISUALIZATION_CACHE_GENERATION_GRACE_PERIOD = 600
+# seconds a worker may hold the lock for rebuilding a missing visualization cache generation
+VISUALIZATION_CACHE_REBUILD_LOCK_TIMEOUT = 600
+# seconds other workers wait for that rebuild before giving up when they have no previous copy to serve
+VISUALIZATION_CACHE_REBUILD_WAIT = 30
+# seconds a changed publication must be left alone before its changes are applied to the visualization dataframes
+VISUALIZATION_DELTA_DEBOUNCE = 30
+# seconds changes without a date_modified of their own, like deleted through rows, are kept in the publication change
+# log. sync_search_index --since only sees these changes within this window
+PUBLICATION_CHANGE_LOG_RETENTION = 30 * 24 * 60 * 60
+# number of visualization dataframes built concurrently, each in its own thread with its own database connection
+VISUALIZATION_CACHE_BUILD_WORKERS = 1
+# seconds a rendered visualization plot is served without being recomputed
+VISUALIZATION_PLOT_CACHE_SOFT_TIMEOUT = 300
+# seconds a rendered visualization plot is kept, served stale while it is recomputed in the background
+VISUALIZATION_PLOT_CACHE_HARD_TIMEOUT = 3600
+# background threads recomputing stale visualization plots in each worker process, and seconds a refresh may take
+VISUALIZATION_PLOT_REFRESH_WORKERS = 2
+VISUALIZATION_PLOT_REFRESH_LOCK_TIMEOUT = 120
+# bytes the rendered visualization plots may hold before the least recently used are evicted, None for no bound
+VISUALIZATION_PLOT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# misses within VISUALIZATION_PLOT_CACHE_ADMISSION_WINDOW seconds before a bounded plot cache stores a plot
+VISUALIZATION_PLOT_CACHE_ADMIT_AFTER = 2
+VISUALIZATION_PLOT_CACHE_ADMISSION_WINDOW = 3600
+# seconds browsers and the front end proxy may reuse a public page without revalidating it
+PUBLIC_PAGE_MAX_AGE = 60
+# seconds past PUBLIC_PAGE_MAX_AGE a public page may still be served while it is revalidated in the background
+PUBLIC_PAGE_STALE_WHILE_REVALIDATE = 600
+
 HAYSTACK_CONNECTIONS = {
     'default': {
         'ENGINE': 'haystack.backends.solr_backend.SolrEngine',
@@ -46,6 +78,18 @@ HAYSTACK_CONNECTIONS = {
     },
 }
 
+# documents sent in each bulk request and concurrent bulk requests for each index when rebuilding the public indices
+SEARCH_INDEX_BULK_CHUNK_SIZE = 500
+SEARCH_INDEX_BULK_THREADS = 4
+# concurrent sliced scrolls retrieving the ids of the publications matching a search
+SEARCH_SCAN_IDS_SLICES = 2
+# seconds the ids of the publications matching a search are cached for
+SEARCH_MATCHED_IDS_TIMEOUT = 300
+# seconds a request scanning the ids of a search holds its lock, and others wait for its result
+SEARCH_MATCHED_IDS_LOCK_TIMEOUT = 30
+# seconds a changed publication must be left alone before its documents are synced to the public search indices
+SEARCH_INDEX_DELTA_DEBOUNCE = 10
+
 ELASTICSEARCH = {
     'default': {
         'hosts': [
@@ -0,0 +1,7 @@
+#!/bin/sh
+# runit service applying publications changed by curators to the cached visualization dataframes
+
+cd /code
+/code/deploy/docker/wait-for-it.sh redis:6379 -- echo "Redis is ready."
+/code/deploy/docker/wait-for-it.sh db:5432 -- echo "Postgres is ready."
+exec python3 manage.py process_visualization_changes --loop
@@ -0,0 +1,7 @@
+#!/bin/sh
+# runit service syncing the public search index documents of publications changed by curators
+
+cd /code
+/code/deploy/docker/wait-for-it.sh redis:6379 -- echo "Redis is ready."
+/code/deploy/docker/wait-for-it.sh elasticsearch:9200 -- echo "ElasticSearch is ready."
+exec python3 manage.py sync_search_index --loop
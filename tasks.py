@@ -173,11 +173,12 @@ def rebuild_solr_index(ctx, noinput=False):
 
 
 @task(aliases=['ri:es'])
-def rebuild_elasticsearch_index(ctx):
+def rebuild_elasticsearch_index(ctx, chunk_size=None, threads=None):
     import django
     django.setup()
     from catalog.core.search_indexes import bulk_index_public
-    bulk_index_public()
+    bulk_index_public(chunk_size=None if chunk_size is None else int(chunk_size),
+                      thread_count=None if threads is None else int(threads))
 
 
 @task(aliases=['ri'], pre=[call(rebuild_solr_index, noinput=True), rebuild_elasticsearch_index])